@@ -1,27 +1,76 @@
+import logging
+from typing import Optional
+
 from client.client import Client
 
 from experiment.experiment import Experiment
+from sampler.stream_statistics import StreamStatistics
 
 class Assistant:
-    def __init__(self, client: Client, experiment: Experiment) -> None:
+    def __init__(self, client: Client, experiment: Experiment, device: Optional[str] = None) -> None:
         # client is used to communicate with the server
         # that is responsible for power measurement
         self.client = client
         self.experiment = experiment
+        # device (of the server) measuring this DUT, None -> all devices
+        self.device = device
+        # experiment code can split its run into phases (see Experiment.mark)
+        self.experiment.set_marker(self.mark)
+
+        # (output filename, device id -> energy / power summary) of every experiment performed
+        self.summaries = []
+        # device id -> power statistics merged over all experiments performed
+        self.power_statistics = {}
         pass
 
-    def perform_one_experiment(self):
+    def mark(self, name: str):
+        self.client.mark(name, device=self.device)
+
+    def perform_one_experiment(self) -> dict[str, dict]:
+        '''
+        returns device id -> energy / power summary of the run
+        '''
         output_filename = self.experiment.get_output_filename()
 
         self.experiment.before_run()
 
-        self.client.req_measurement(output_filename)
+        # maps timestamps of this device (time.time()) onto the samples of the run
+        clock = self.client.sync_clock()
+
+        # returns once the first sample has been taken
+        start_reply = self.client.req_measurement(output_filename, device=self.device, clock=clock)
+        logging.info(f"Measurement started, start latency: {start_reply['start_latency'] * 1000:.3f} ms, round-trip: {start_reply['round_trip_time'] * 1000:.3f} ms")
+
         self.experiment.run()
-        self.client.stop_measurement()
+
+        stop_reply = self.client.stop_measurement(device=self.device)
+        logging.info(f"Measurement stopped, round-trip: {stop_reply['round_trip_time'] * 1000:.3f} ms")
+
+        for device_id, summary in stop_reply["summaries"].items():
+            logging.info(f"[{device_id}] energy: {summary['energy']:.3f} J, average power: {summary['average_power']:.3f} W, peak power: {summary['peak_power']:.3f} W, duration: {summary['duration']:.3f} s")
+            for phase in summary.get("phases", []):
+                logging.info(f"[{device_id}]   {phase['name']}: {phase['energy']:.3f} J, average power: {phase['average_power']:.3f} W, duration: {phase['duration']:.3f} s")
+        self.summaries.append((output_filename, stop_reply["summaries"]))
+
+        for device_id, summary in stop_reply["summaries"].items():
+            statistics = StreamStatistics.from_dict(summary["power_statistics"])
+            if device_id in self.power_statistics:
+                self.power_statistics[device_id].merge(statistics)
+            else:
+                self.power_statistics[device_id] = statistics
 
         self.experiment.after_run()
 
+        return stop_reply["summaries"]
+
     def perform_all_experiments(self):
-        # TODO: 
-        while not self.experiment.all_finished():
-            self.perform_one_experiment()
+        # one session with the server for all experiments
+        self.client.connect()
+        try:
+            while not self.experiment.all_finished():
+                self.perform_one_experiment()
+        finally:
+            self.client.close()
+
+        for device_id, statistics in self.power_statistics.items():
+            logging.info(f"[{device_id}] power over all experiments: {statistics.get_summary()}")
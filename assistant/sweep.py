@@ -0,0 +1,209 @@
+import logging
+import math
+import time
+from statistics import NormalDist
+from typing import Optional
+
+from assistant.assistant import Assistant
+from client.client import Client
+from experiment.experiment import Experiment
+from utils.utils import write_csv, write_csv_rows
+
+DEFAULT_WARMUP_RUNS = 1
+DEFAULT_COOLDOWN = 0.0 # sec
+DEFAULT_MIN_RUNS = 3
+DEFAULT_MAX_RUNS = 30
+DEFAULT_CONFIDENCE = 0.95
+# half width of the confidence interval relative to the mean energy
+DEFAULT_TARGET_RELATIVE_HALF_WIDTH = 0.05
+
+RESULT_TITLES = [
+    "configuration", "runs", "mean_energy [J]", "ci_low [J]", "ci_high [J]",
+    "relative_half_width", "mean_duration [s]", "mean_power [W]", "converged",
+]
+
+
+def t_quantile(p: float, df: int) -> float:
+    '''
+    quantile of Student's t distribution (exact for df <= 2,
+    Cornish-Fisher expansion within 1% for df >= 3)
+    '''
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+
+    z = NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def confidence_interval(values: list[float], confidence: float = DEFAULT_CONFIDENCE) -> tuple[float, float]:
+    '''
+    returns (mean, half width of the confidence interval of the mean)
+    '''
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return mean, math.inf
+
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    return mean, t_quantile((1 + confidence) / 2, n - 1) * math.sqrt(variance / n)
+
+
+class SweepRunner:
+    '''
+    Repeats every configuration (an experiment) until the confidence interval
+    of its energy is narrow enough or its budget runs out:
+
+        warmup runs (not measured) -> [ run -> cooldown ] * (min_runs .. max_runs)
+
+    the energy of a run is the sum over the devices measuring the DUT.
+
+    run() of an experiment is called once per run (warmups included), so it must
+    repeat the same work every time: reset any state it changes in before_run().
+    '''
+    def __init__(
+        self,
+        client: Client,
+        configurations: dict[str, Experiment],
+        device: Optional[str] = None,
+        warmup_runs: int = DEFAULT_WARMUP_RUNS,
+        cooldown: float = DEFAULT_COOLDOWN,
+        min_runs: int = DEFAULT_MIN_RUNS,
+        max_runs: int = DEFAULT_MAX_RUNS,
+        confidence: float = DEFAULT_CONFIDENCE,
+        target_relative_half_width: float = DEFAULT_TARGET_RELATIVE_HALF_WIDTH,
+        time_budget: Optional[float] = None,
+    ) -> None:
+        # at least 2 degrees of freedom for the confidence interval
+        if min_runs < 3:
+            raise ValueError(f"min_runs must be at least 3, got {min_runs}")
+
+        self.client = client
+        # configuration name -> experiment
+        self.configurations = configurations
+        self.device = device
+
+        self.warmup_runs = warmup_runs
+        # sec of idle between runs (e.g. to let the DUT cool down)
+        self.cooldown = cooldown
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.confidence = confidence
+        self.target_relative_half_width = target_relative_half_width
+        # sec for the whole sweep (None -> no limit), checked between runs
+        self.time_budget = time_budget
+
+        # configuration name -> energy of every measured run [J]
+        self.energies = {}
+        # configuration name -> duration of every measured run [s]
+        self.durations = {}
+
+    def _converged(self, name: str) -> bool:
+        energies = self.energies[name]
+        if len(energies) < self.min_runs:
+            return False
+
+        mean, half_width = confidence_interval(energies, self.confidence)
+        return mean != 0 and half_width / abs(mean) <= self.target_relative_half_width
+
+    def _cooldown(self):
+        if self.cooldown > 0:
+            time.sleep(self.cooldown)
+
+    def run_configuration(self, name: str, deadline: Optional[float] = None):
+        experiment = self.configurations[name]
+        self.energies[name] = []
+        self.durations[name] = []
+
+        # no measurement during warmups: no markers either
+        experiment.set_marker(None)
+        for i in range(self.warmup_runs):
+            logging.info(f"[{name}] warmup run {i + 1}/{self.warmup_runs}")
+            experiment.before_run()
+            experiment.run()
+            experiment.after_run()
+            self._cooldown()
+
+        assistant = Assistant(self.client, experiment, device=self.device)
+        while len(self.energies[name]) < self.max_runs:
+            if deadline is not None and time.monotonic() >= deadline:
+                logging.info(f"[{name}] time budget exhausted")
+                break
+
+            summaries = assistant.perform_one_experiment()
+            self.energies[name].append(sum(summary["energy"] for summary in summaries.values()))
+            self.durations[name].append(max(summary["duration"] for summary in summaries.values()))
+
+            if self._converged(name):
+                break
+            self._cooldown()
+
+        logging.info(f"[{name}] {self.get_result(name)}")
+
+    def run(self) -> list[dict]:
+        '''
+        runs every configuration in turn, returns the results table
+        '''
+        deadline = None
+        if self.time_budget is not None:
+            deadline = time.monotonic() + self.time_budget
+
+        # one session with the server for the whole sweep
+        self.client.connect()
+        try:
+            for name in self.configurations:
+                self.run_configuration(name, deadline)
+        finally:
+            self.client.close()
+
+        return self.get_results()
+
+    def get_result(self, name: str) -> dict:
+        energies = self.energies[name]
+        durations = self.durations[name]
+        if not energies:
+            return { "configuration": name, "runs": 0, "converged": False }
+
+        mean, half_width = confidence_interval(energies, self.confidence)
+        mean_duration = sum(durations) / len(durations)
+        return {
+            "configuration": name,
+            "runs": len(energies),
+            "mean_energy": mean,
+            "ci_low": mean - half_width,
+            "ci_high": mean + half_width,
+            "relative_half_width": half_width / abs(mean) if mean != 0 else math.inf,
+            "mean_duration": mean_duration,
+            "mean_power": mean / mean_duration if mean_duration > 0 else 0.0,
+            "converged": self._converged(name),
+        }
+
+    def get_results(self) -> list[dict]:
+        return [ self.get_result(name) for name in self.energies ]
+
+    def log_results(self):
+        for result in self.get_results():
+            if result["runs"] == 0:
+                logging.info(f"{result['configuration']}: no run")
+                continue
+
+            logging.info(
+                f"{result['configuration']}: {result['mean_energy']:.3f} J "
+                f"[{result['ci_low']:.3f}, {result['ci_high']:.3f}] ({result['relative_half_width'] * 100:.1f} %), "
+                f"{result['runs']} runs, {result['mean_power']:.3f} W"
+                f"{'' if result['converged'] else ' (not converged)'}"
+            )
+
+    def write_results(self, filename: str):
+        '''
+        results table as csv (one row per configuration)
+        '''
+        keys = [ title.split(" ")[0] for title in RESULT_TITLES ]
+        with open(filename, 'w') as csv:
+            write_csv(csv, RESULT_TITLES)
+            write_csv_rows(csv, [ [ result.get(key, "") for key in keys ] for result in self.get_results() ])
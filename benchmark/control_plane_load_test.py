@@ -0,0 +1,251 @@
+import logging
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from client.client import Client
+from device_controller.demo_device_controller import DemoDeviceController
+from protocol.protocol import MARK, START, STATS, STOP
+from sampler.energy import summary_filename
+from sampler.sampler import Sampler, SamplerState
+from sampler.stream_statistics import StreamStatistics
+from server.server import Server
+
+HOST = "127.0.0.1"
+
+DEFAULT_NUM_CLIENTS = 16
+DEFAULT_NUM_DEVICES = 4
+DEFAULT_DURATION = 10.0 # sec
+# every client waits uniform(0, max think time) between two commands
+DEFAULT_MAX_THINK_TIME = 0.02 # sec
+DEFAULT_SAMPLING_INTERVAL = 0.01 # sec
+
+COMMANDS = (START, STOP, STATS, MARK)
+
+# what a client with a run does next (the others start one)
+_RUNNING_COMMANDS = (STOP, STATS, MARK)
+_RUNNING_WEIGHTS = (2, 1, 2)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_server(port: int, timeout: float = 5.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            socket.create_connection((HOST, port), timeout=timeout).close()
+            return
+        except ConnectionRefusedError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+class _LoadClient():
+    '''
+    One simulated DUT script with its own session: starts runs on random devices
+    (rejected while another client measures the device), then stops its run,
+    asks for statistics or sends markers, in a random order (reproducible from its seed).
+    '''
+    def __init__(self, index: int, port: int, devices: list[str], output_dir: str, duration: float, max_think_time: float, seed: int) -> None:
+        self.index = index
+        self.port = port
+        self.devices = devices
+        self.output_dir = output_dir
+        self.duration = duration
+        self.max_think_time = max_think_time
+        self.random = random.Random(seed)
+
+        # command -> replies ok / rejected by the server / no reply (after one reconnect)
+        self.ok = dict.fromkeys(COMMANDS, 0)
+        self.rejected = dict.fromkeys(COMMANDS, 0)
+        self.lost = dict.fromkeys(COMMANDS, 0)
+        # runs started (sample files), runs whose STOP did not return their summary
+        self.started = []
+        self.lost_runs = 0
+
+        self.round_trip_times = []
+        self.num_misordered = 0
+        self.num_reconnects = 0
+        self.error = None
+
+    def _start(self, client: Client) -> Optional[str]:
+        device = self.random.choice(self.devices)
+        filename = os.path.join(self.output_dir, f"client{self.index}_{len(self.started)}_{device}.csv")
+        try:
+            client.req_measurement(filename, device=device)
+        except RuntimeError:
+            self.rejected[START] += 1
+            return None
+
+        self.ok[START] += 1
+        self.started.append(filename)
+        return device
+
+    def _stop(self, client: Client, device: str):
+        summaries = client.stop_measurement(device=device)["summaries"]
+        self.ok[STOP] += 1
+        if device not in summaries:
+            self.lost_runs += 1
+
+    def _run_commands(self, client: Client):
+        running = None
+        deadline = time.perf_counter() + self.duration
+        while time.perf_counter() < deadline:
+            time.sleep(self.random.uniform(0.0, self.max_think_time))
+
+            command = START if running is None else self.random.choices(_RUNNING_COMMANDS, _RUNNING_WEIGHTS)[0]
+            try:
+                if command == START:
+                    running = self._start(client)
+                elif command == STOP:
+                    self._stop(client, running)
+                    running = None
+                elif command == STATS:
+                    client.get_statistics(device=self.random.choice(self.devices))
+                    self.ok[STATS] += 1
+                else:
+                    client.mark(f"phase{self.ok[MARK]}", device=running)
+                    self.ok[MARK] += 1
+            except (ConnectionError, OSError) as err:
+                logging.warning(f"client{self.index}: {command} lost ({err})")
+                self.lost[command] += 1
+                if command == STOP:
+                    running = None
+
+        if running is not None:
+            self._stop(client, running)
+
+    def run(self):
+        client = Client(HOST, self.port)
+        try:
+            with client:
+                self._run_commands(client)
+        except Exception as err:
+            # e.g. RuntimeError of a STOP: reported, not raised in the thread
+            self.error = err
+        finally:
+            self.round_trip_times = client.round_trip_times
+            self.num_misordered = client.num_misordered
+            self.num_reconnects = client.num_reconnects
+
+
+def run_load_test(
+    num_clients: int = DEFAULT_NUM_CLIENTS,
+    num_devices: int = DEFAULT_NUM_DEVICES,
+    duration: float = DEFAULT_DURATION,
+    max_think_time: float = DEFAULT_MAX_THINK_TIME,
+    sampling_interval: float = DEFAULT_SAMPLING_INTERVAL,
+    seed: int = 0,
+    output_dir: Optional[str] = None,
+) -> dict:
+    '''
+    runs a local server with num_devices DemoDeviceControllers and num_clients concurrent clients
+    sending random START / STOP / STATS / MARK sequences for `duration` seconds,
+    returns throughput, latency per command and every lost / misordered command
+    '''
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        devices = [ f"demo{i}" for i in range(num_devices) ]
+        samplers = {
+            device_id: Sampler(
+                device_controller=DemoDeviceController(),
+                output_filename=os.path.join(tmp_dir, "unused.csv"),
+                sampling_interval=sampling_interval,
+                device_id=device_id,
+            )
+            for device_id in devices
+        }
+        port = _free_port()
+        server = Server(samplers=samplers, host=HOST, port=port)
+        server_thread = threading.Thread(target=server.run)
+        server_thread.start()
+
+        try:
+            _wait_for_server(port)
+
+            clients = [ _LoadClient(i, port, devices, tmp_dir, duration, max_think_time, seed + i) for i in range(num_clients) ]
+            threads = [ threading.Thread(target=c.run) for c in clients ]
+            start_time = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall_time = time.perf_counter() - start_time
+
+            # a device still measuring: its STOP was lost
+            stuck_devices = [ device_id for device_id, sampler in samplers.items() if sampler.get_state() is not SamplerState.IDLE ]
+        finally:
+            server.stop()
+            server_thread.join()
+
+        # every run started must have left its summary next to its sample file
+        started = [ filename for c in clients for filename in c.started ]
+        missing_summaries = [ filename for filename in started if not os.path.exists(summary_filename(filename)) ]
+
+    latencies = { command: StreamStatistics() for command in COMMANDS }
+    for c in clients:
+        for command, round_trip_time in c.round_trip_times:
+            latencies[command].add(round_trip_time)
+
+    commands = {}
+    for command in COMMANDS:
+        latency = latencies[command].get_summary()
+        commands[command] = {
+            "ok": sum(c.ok[command] for c in clients),
+            "rejected": sum(c.rejected[command] for c in clients),
+            "lost": sum(c.lost[command] for c in clients),
+            "latency_p50": latency.get("p50", 0.0),     # sec
+            "latency_p95": latency.get("p95", 0.0),     # sec
+            "latency_p99": latency.get("p99", 0.0),     # sec
+            "latency_max": latency.get("max", 0.0),     # sec
+        }
+
+    num_commands = sum(r["ok"] + r["rejected"] for r in commands.values())
+    return {
+        "clients": num_clients,
+        "devices": num_devices,
+        "duration": wall_time,                          # sec
+        "commands": num_commands,
+        "throughput": num_commands / wall_time,         # commands / sec
+        "per_command": commands,
+        "runs": len(started),
+        "lost_commands": sum(r["lost"] for r in commands.values()),
+        "lost_runs": sum(c.lost_runs for c in clients) + len(missing_summaries),
+        "stuck_devices": stuck_devices,
+        "misordered": sum(c.num_misordered for c in clients),
+        "reconnects": sum(c.num_reconnects for c in clients),
+        "client_errors": [ f"client{c.index}: {c.error}" for c in clients if c.error is not None ],
+    }
+
+
+def format_results(result: dict) -> str:
+    lines = [
+        f"{result['clients']} clients, {result['devices']} devices, {result['duration']:.1f} s: "
+        f"{result['commands']} commands ({result['throughput']:.1f}/s), {result['runs']} runs",
+        f"{'command':>10} {'ok':>8} {'rejected':>9} {'lost':>6} {'latency p50/p95/p99/max [ms]':>32}",
+    ]
+    for command, r in result["per_command"].items():
+        # MARK: no reply, no latency
+        latency = "-" if command == MARK else (
+            f"{r['latency_p50'] * 1000:.2f}/{r['latency_p95'] * 1000:.2f}/{r['latency_p99'] * 1000:.2f}/{r['latency_max'] * 1000:.2f}"
+        )
+        lines.append(f"{command:>10} {r['ok']:>8} {r['rejected']:>9} {r['lost']:>6} {latency:>32}")
+
+    lines.append(
+        f"lost commands: {result['lost_commands']}, lost runs: {result['lost_runs']}, "
+        f"stuck devices: {result['stuck_devices'] or 0}, misordered replies: {result['misordered']}, reconnects: {result['reconnects']}"
+    )
+    lines += result["client_errors"]
+    return "\n".join(lines)
+
+
+def has_failures(result: dict) -> bool:
+    return bool(result["lost_commands"] or result["lost_runs"] or result["stuck_devices"] or result["misordered"] or result["client_errors"])
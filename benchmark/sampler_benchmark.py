@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from device_controller.simulated_device_controller import SimulatedDeviceController
+from sampler.sampler import Sampler
+from sampler.scheduler import SKIP
+from sampler.stream_statistics import StreamStatistics
+from writer.writer import DEFAULT_OUTPUT_FORMAT, WriterListener
+
+DEFAULT_SAMPLING_INTERVALS = (0.1, 0.01, 0.005, 0.002, 0.001) # sec
+DEFAULT_DURATION = 5.0 # sec per sampling interval
+
+# a result is a regression when it is worse than the baseline by more than this fraction
+DEFAULT_TOLERANCE = 0.2
+# jitter below this is noise (sleep granularity of the OS), never a regression
+JITTER_FLOOR = 0.0002 # sec
+
+
+class _TimestampCollector(WriterListener):
+    '''
+    collects the intervals between the samples handled by the writer
+    '''
+    def __init__(self, sampling_interval: float) -> None:
+        self.sampling_interval = sampling_interval
+        self.first_time = None
+        self.last_time = None
+        self.num_samples = 0
+        # |interval between two samples - sampling interval|
+        self.jitter = StreamStatistics()
+
+    def on_batch(self, records: list[tuple[float, ...]]):
+        for record in records:
+            timestamp = record[0]
+            if self.last_time is None:
+                self.first_time = timestamp
+            else:
+                self.jitter.add(abs(timestamp - self.last_time - self.sampling_interval))
+            self.last_time = timestamp
+            self.num_samples += 1
+
+
+def run_one(
+    sampling_interval: float,
+    duration: float = DEFAULT_DURATION,
+    query_latency: float = 0.0,
+    query_jitter: float = 0.0,
+    combined_query: bool = True,
+    schedule_policy: str = SKIP,
+    output_format: str = DEFAULT_OUTPUT_FORMAT,
+    output_dir: Optional[str] = None,
+) -> dict:
+    '''
+    samples a SimulatedDeviceController for `duration` seconds
+    (measuring and writing threads as in the server)
+    '''
+    device_controller = SimulatedDeviceController(query_latency, query_jitter, combined_query)
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        filename = os.path.join(tmp_dir, f"benchmark_{sampling_interval}.csv")
+        sampler = Sampler(
+            device_controller=device_controller,
+            output_filename=filename,
+            sampling_interval=sampling_interval,
+            schedule_policy=schedule_policy,
+            output_format=output_format,
+        )
+        collector = _TimestampCollector(sampling_interval)
+        sampler.writer.add_listener(collector)
+
+        threads = [ threading.Thread(target=sampler.measure), threading.Thread(target=sampler.writer.write) ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            start_cpu = time.process_time()
+            start_time = time.perf_counter()
+            sampler.start_measurement(filename)
+            time.sleep(duration)
+            summary = sampler.stop_measurement()
+            wall_time = time.perf_counter() - start_time
+            cpu_time = time.process_time() - start_cpu
+        finally:
+            sampler.shutdown()
+            for thread in threads:
+                thread.join()
+            sampler.close()
+
+        output_filename = [ os.path.join(tmp_dir, f) for f in os.listdir(tmp_dir) if not f.endswith(".summary.json") ][0]
+        output_bytes = os.path.getsize(output_filename)
+        writer_stats = sampler.writer.get_stats()
+
+    sampled_time = (collector.last_time - collector.first_time) if collector.num_samples > 1 else 0.0
+    achieved_rate = (collector.num_samples - 1) / sampled_time if sampled_time > 0 else 0.0
+    jitter = collector.jitter.get_summary()
+
+    return {
+        "sampling_interval": sampling_interval,     # sec
+        "target_rate": 1.0 / sampling_interval,     # Hz
+        "achieved_rate": achieved_rate,             # Hz
+        "samples": collector.num_samples,
+        "expected_samples": int(sampled_time / sampling_interval) + 1,
+        "jitter_p50": jitter.get("p50", 0.0),       # sec
+        "jitter_p95": jitter.get("p95", 0.0),       # sec
+        "jitter_p99": jitter.get("p99", 0.0),       # sec
+        "jitter_max": jitter.get("max", 0.0),       # sec
+        "cpu": cpu_time / wall_time,                # cpu seconds per second (all threads)
+        "write_records_per_sec": writer_stats["records"] / wall_time,
+        "write_bytes_per_sec": output_bytes / wall_time,
+        "max_queue_depth": writer_stats["max_queue_depth"],
+        "backpressure": writer_stats["backpressure"],
+        "sampled": summary["samples"] if summary is not None else 0, # samples taken by the sampler
+    }
+
+
+def run_all(sampling_intervals: tuple[float, ...] = DEFAULT_SAMPLING_INTERVALS, **kwargs) -> list[dict]:
+    results = []
+    for sampling_interval in sampling_intervals:
+        logging.warning(f"Benchmarking sampling interval {sampling_interval} s...")
+        results.append(run_one(sampling_interval, **kwargs))
+
+    return results
+
+
+def format_results(results: list[dict]) -> str:
+    lines = [ f"{'interval [s]':>12} {'rate [Hz]':>10} {'achieved':>10} {'jitter p50/p95/p99 [ms]':>26} {'cpu':>6} {'records/s':>10} {'bytes/s':>10}" ]
+    for r in results:
+        jitter = f"{r['jitter_p50'] * 1000:.3f}/{r['jitter_p95'] * 1000:.3f}/{r['jitter_p99'] * 1000:.3f}"
+        lines.append(
+            f"{r['sampling_interval']:>12g} {r['target_rate']:>10.1f} {r['achieved_rate']:>10.1f} {jitter:>26} "
+            f"{r['cpu'] * 100:>5.1f}% {r['write_records_per_sec']:>10.1f} {r['write_bytes_per_sec']:>10.0f}"
+        )
+    return "\n".join(lines)
+
+
+def save_baseline(filename: str, results: list[dict], parameters: dict):
+    with open(filename, 'w') as baseline_json:
+        json.dump({ "parameters": parameters, "results": results }, baseline_json, indent=4)
+
+
+def load_baseline(filename: str) -> dict:
+    with open(filename) as baseline_json:
+        return json.load(baseline_json)
+
+
+def compare_with_baseline(results: list[dict], baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    '''
+    returns a description of every regression (empty: no regression)
+    '''
+    baseline_results = { r["sampling_interval"]: r for r in baseline["results"] }
+
+    regressions = []
+    for r in results:
+        b = baseline_results.get(r["sampling_interval"])
+        if b is None:
+            continue
+
+        interval = r["sampling_interval"]
+        if r["achieved_rate"] < b["achieved_rate"] * (1 - tolerance):
+            regressions.append(f"{interval} s: achieved rate {r['achieved_rate']:.1f} Hz < baseline {b['achieved_rate']:.1f} Hz")
+        if r["jitter_p99"] > max(b["jitter_p99"] * (1 + tolerance), JITTER_FLOOR):
+            regressions.append(f"{interval} s: jitter p99 {r['jitter_p99'] * 1000:.3f} ms > baseline {b['jitter_p99'] * 1000:.3f} ms")
+        if r["cpu"] > max(b["cpu"] * (1 + tolerance), b["cpu"] + 0.01):
+            regressions.append(f"{interval} s: cpu {r['cpu'] * 100:.1f}% > baseline {b['cpu'] * 100:.1f}%")
+
+    return regressions
@@ -0,0 +1,64 @@
+import os
+import random
+import tempfile
+import time
+from typing import Optional
+
+from writer.writer import OUTPUT_FORMATS
+
+DEFAULT_NUM_RECORDS = 100000
+DEFAULT_BATCH_SIZE = 64
+
+TITLES = ("epoch", "Current [A]", "Voltage [V]")
+
+
+def make_records(num_records: int, sampling_interval: float = 0.05) -> list[tuple[float, ...]]:
+    '''
+    samples like the meter's: perf_counter timestamps, readings with 4 decimals
+    '''
+    records = []
+    timestamp = time.perf_counter()
+    for _ in range(num_records):
+        timestamp += sampling_interval + random.uniform(-1e-4, 1e-4)
+        records.append((timestamp, round(2.5 + random.gauss(0.0, 0.01), 4), round(5.1 + random.gauss(0.0, 0.001), 4)))
+    return records
+
+
+def run_one(output_format: str, records: list[tuple[float, ...]], batch_size: int = DEFAULT_BATCH_SIZE, output_dir: Optional[str] = None) -> dict:
+    '''
+    writes the records through the sink of output_format in batches (as the writer does)
+    '''
+    sink_class = OUTPUT_FORMATS[output_format]
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        filename = sink_class.output_filename(os.path.join(tmp_dir, "benchmark.csv"))
+
+        start_cpu = time.process_time()
+        sink = sink_class(filename, TITLES)
+        for i in range(0, len(records), batch_size):
+            sink.write_batch(records[i:i + batch_size])
+        sink.close()
+        cpu_time = time.process_time() - start_cpu
+
+        num_bytes = os.path.getsize(filename)
+
+    return {
+        "output_format": output_format,
+        "bytes": num_bytes,
+        "bytes_per_record": num_bytes / len(records),
+        "cpu_per_record": cpu_time / len(records), # sec
+    }
+
+
+def run_all(num_records: int = DEFAULT_NUM_RECORDS, batch_size: int = DEFAULT_BATCH_SIZE) -> list[dict]:
+    records = make_records(num_records)
+    return [ run_one(output_format, records, batch_size) for output_format in OUTPUT_FORMATS ]
+
+
+def format_results(results: list[dict]) -> str:
+    csv_bytes = next((r["bytes"] for r in results if r["output_format"] == "csv"), None)
+
+    lines = [ f"{'format':>12} {'bytes':>12} {'bytes/record':>13} {'vs csv':>7} {'cpu/record [us]':>16}" ]
+    for r in results:
+        ratio = f"{r['bytes'] / csv_bytes:.2f}" if csv_bytes else "-"
+        lines.append(f"{r['output_format']:>12} {r['bytes']:>12} {r['bytes_per_record']:>13.2f} {ratio:>7} {r['cpu_per_record'] * 1e6:>16.2f}")
+    return "\n".join(lines)
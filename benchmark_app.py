@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+from logging import DEBUG, WARNING
+
+from benchmark import control_plane_load_test, storage_benchmark
+from benchmark.sampler_benchmark import (DEFAULT_DURATION, DEFAULT_SAMPLING_INTERVALS, DEFAULT_TOLERANCE,
+                                         compare_with_baseline, format_results, load_baseline, run_all,
+                                         save_baseline)
+from sampler.scheduler import POLICIES, SKIP
+from utils.utils import enable_logging
+from writer.writer import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="measure the sampling rate / jitter the sampler sustains on a simulated instrument (no instrument required)"
+    )
+
+    parser.add_argument(
+        "-V",
+        "--verbose",
+        action="store_true",
+        default=False,
+        help="set -V to get more detailed logs (default: False)"
+    )
+
+    parser.add_argument(
+        "--sampling_intervals",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_SAMPLING_INTERVALS),
+        help=f"set the sampling intervals to benchmark in seconds (default: {' '.join(map(str, DEFAULT_SAMPLING_INTERVALS))})"
+    )
+
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=DEFAULT_DURATION,
+        help=f"set how long each sampling interval (or --control_plane) is benchmarked in seconds (default: {DEFAULT_DURATION} s)"
+    )
+
+    parser.add_argument(
+        "--query_latency",
+        type=float,
+        default=0.0,
+        help="set the simulated latency of every query in seconds (default: 0 s)"
+    )
+
+    parser.add_argument(
+        "--query_jitter",
+        type=float,
+        default=0.0,
+        help="set the simulated jitter (uniform, added to the latency) of every query in seconds (default: 0 s)"
+    )
+
+    parser.add_argument(
+        "--separate_queries",
+        action="store_true",
+        default=False,
+        help="set --separate_queries to simulate one query for current and one for voltage (default: False)"
+    )
+
+    parser.add_argument(
+        "--schedule_policy",
+        choices=POLICIES,
+        default=SKIP,
+        help=f"set what to do when sampling deadlines are missed (default: {SKIP})"
+    )
+
+    parser.add_argument(
+        "--output_format",
+        choices=tuple(OUTPUT_FORMATS),
+        default=DEFAULT_OUTPUT_FORMAT,
+        help=f"set the format of the files storing measured values (default: {DEFAULT_OUTPUT_FORMAT})"
+    )
+
+    parser.add_argument(
+        "--storage",
+        action="store_true",
+        default=False,
+        help="set --storage to compare bytes written and cpu cost of the output formats instead (no sampling)"
+    )
+
+    parser.add_argument(
+        "--control_plane",
+        action="store_true",
+        default=False,
+        help="set --control_plane to load-test the server with concurrent clients sending random start / stop sequences instead (exit status 1 on lost / misordered commands)"
+    )
+
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=control_plane_load_test.DEFAULT_NUM_CLIENTS,
+        help=f"set the number of concurrent clients of --control_plane (default: {control_plane_load_test.DEFAULT_NUM_CLIENTS})"
+    )
+
+    parser.add_argument(
+        "--devices",
+        type=int,
+        default=control_plane_load_test.DEFAULT_NUM_DEVICES,
+        help=f"set the number of demo devices of --control_plane (default: {control_plane_load_test.DEFAULT_NUM_DEVICES})"
+    )
+
+    parser.add_argument(
+        "--think_time",
+        type=float,
+        default=control_plane_load_test.DEFAULT_MAX_THINK_TIME,
+        help=f"set the maximum random wait between two commands of a client of --control_plane in seconds (default: {control_plane_load_test.DEFAULT_MAX_THINK_TIME} s)"
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="set the seed of the random command sequences of --control_plane (default: 0)"
+    )
+
+    parser.add_argument(
+        "--save_baseline",
+        default=None,
+        help="set a json file to save the results to as the new baseline"
+    )
+
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="set a json file of baseline results to compare with (exit status 1 on regression)"
+    )
+
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"set how much worse than the baseline is a regression (default: {DEFAULT_TOLERANCE})"
+    )
+
+    args = parser.parse_args()
+
+    return {
+        "verbose": args.verbose,
+        "sampling_intervals": tuple(args.sampling_intervals),
+        "duration": args.duration,
+        "query_latency": args.query_latency,
+        "query_jitter": args.query_jitter,
+        "combined_query": not args.separate_queries,
+        "schedule_policy": args.schedule_policy,
+        "output_format": args.output_format,
+        "save_baseline": args.save_baseline,
+        "baseline": args.baseline,
+        "tolerance": args.tolerance,
+        "storage": args.storage,
+        "control_plane": args.control_plane,
+        "clients": args.clients,
+        "devices": args.devices,
+        "think_time": args.think_time,
+        "seed": args.seed,
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    # per-sample logs are part of the measured cost, but not printed
+    log_level = DEBUG if args["verbose"] else WARNING
+    enable_logging(level=log_level)
+
+    if args["storage"]:
+        print(storage_benchmark.format_results(storage_benchmark.run_all()))
+        sys.exit(0)
+
+    if args["control_plane"]:
+        result = control_plane_load_test.run_load_test(
+            num_clients=args["clients"],
+            num_devices=args["devices"],
+            duration=args["duration"],
+            max_think_time=args["think_time"],
+            seed=args["seed"],
+        )
+        print(control_plane_load_test.format_results(result))
+        sys.exit(1 if control_plane_load_test.has_failures(result) else 0)
+
+    parameters = {
+        key: args[key]
+        for key in ("duration", "query_latency", "query_jitter", "combined_query", "schedule_policy", "output_format")
+    }
+    results = run_all(args["sampling_intervals"], **parameters)
+    print(format_results(results))
+
+    if args["save_baseline"] is not None:
+        save_baseline(args["save_baseline"], results, parameters)
+
+    if args["baseline"] is not None:
+        baseline = load_baseline(args["baseline"])
+        if baseline["parameters"] != parameters:
+            print(f"WARNING: baseline was measured with {baseline['parameters']}")
+
+        regressions = compare_with_baseline(results, baseline, args["tolerance"])
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
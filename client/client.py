@@ -1,32 +1,284 @@
 import logging
+import select
 import socket
 import sys
+import time
+from typing import Callable, Iterator, Optional
+
+from client.clock_sync import ClockSync
+from protocol import sample_frame
+from protocol.protocol import MARK, PING, START, STATS, STOP, SUBSCRIBE, recv_frame, recv_message, send_message
+
+# seconds of idle before keepalive probes are sent, between probes, probes before giving up
+KEEPALIVE_IDLE = 10
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_COUNT = 3
+
+# ping exchanges per clock synchronization
+DEFAULT_NUM_PINGS = 8
+
+# requests that can be sent again when their reply is lost
+# (the server may have executed them already: START / STOP must not run twice)
+IDEMPOTENT_COMMANDS = (PING, STATS)
+
+
+class RequestNotSentError(ConnectionError):
+    '''
+    the session broke before the whole request was sent: the server did not execute it
+    '''
 
 class Client:
     def __init__(self, host: str, port: int) -> None:
         self.host = host
         self.port = port
 
-    def _req(self, command: str):
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                logging.info("Connecting to server...")
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                s.connect((self.host, self.port))
-                logging.info("Connected to server!")
+        # one long-lived session (socket) used for every request
+        self._sock = None
+
+        # (command, seconds) of every control round-trip
+        self.round_trip_times = []
+
+        # id of the last request (echoed back in its reply)
+        self._request_id = 0
+        # sessions dropped and reopened, replies not answering the request just sent
+        self.num_reconnects = 0
+        self.num_misordered = 0
+
+        # offset / drift between time.time() of this device and the server's perf_counter,
+        # estimated from all ping exchanges of the session (see sync_clock)
+        self.clock_sync = ClockSync()
+
+    def __enter__(self):
+        self.connect()
+        return self
 
-                logging.info(f"Sending command: {command}")
-                s.sendall(command.encode('utf-8'))
+    def __exit__(self, *args):
+        self.close()
+
+    def connect(self):
+        if self._sock is not None:
+            return
+
+        try:
+            logging.info("Connecting to server...")
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # requests are small, send them right away
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # detect a dead session while experiments are running
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE)
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVAL)
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_COUNT)
+            s.connect((self.host, self.port))
+            logging.info("Connected to server!")
         except ConnectionRefusedError:
+            s.close()
             logging.info("Server is not accepting connection yet. Try starting the server and rerun client app.")
             sys.exit(1)
 
-    def req_measurement(self, output_filename: str):
+        self._sock = s
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _reconnect(self, err: Exception):
+        logging.info(f"Session lost ({err}), reconnecting...")
+        self.num_reconnects += 1
+        self.close()
+
+    def _is_stale(self) -> bool:
+        '''
+        the server closed the idle session (e.g. it was restarted)
+        '''
+        readable, _, _ = select.select([ self._sock ], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return self._sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def _open_session(self):
+        '''
+        connects, replacing a session closed by the server before anything is sent on it
+        '''
+        if self._sock is not None and self._is_stale():
+            self._reconnect(ConnectionError("closed by the server"))
+        self.connect()
+
+    def _send_request(self, request: dict) -> dict:
+        self._request_id += 1
+        request = { **request, "id": self._request_id }
+        try:
+            self._open_session()
+            send_message(self._sock, request)
+        except (ConnectionError, OSError) as err:
+            raise RequestNotSentError(f"request not sent: {err}") from err
+
+        reply = recv_message(self._sock)
+        if reply is None:
+            raise ConnectionError("server closed the connection without replying")
+
+        # replies without id: server not echoing ids
+        if reply.get("id", request["id"]) != request["id"]:
+            # the session is out of step, it is dropped
+            self.num_misordered += 1
+            raise ConnectionError(f"received the reply to request {reply['id']} instead of {request['id']}")
+
+        return reply
+
+    def _req(self, request: dict) -> dict:
+        logging.info(f"Sending request: {request}")
+        start_time = time.perf_counter()
+
+        try:
+            reply = self._send_request(request)
+        except (ConnectionError, OSError) as err:
+            # session broken (e.g. server restarted): reconnect, and send again (once)
+            # unless the server may have executed the request already
+            self._reconnect(err)
+            if not isinstance(err, RequestNotSentError) and request["command"] not in IDEMPOTENT_COMMANDS:
+                raise
+            reply = self._send_request(request)
+
+        round_trip_time = time.perf_counter() - start_time
+        self.round_trip_times.append((request["command"], round_trip_time))
+        logging.debug(f"Reply: {reply} (round-trip: {round_trip_time * 1000:.3f} ms)")
+
+        if not reply["ok"]:
+            raise RuntimeError(f"server failed to execute {request['command']}: {reply['error']}")
+
+        reply["round_trip_time"] = round_trip_time
+        return reply
+
+    def sync_clock(self, num_pings: int = DEFAULT_NUM_PINGS) -> Optional[dict]:
+        '''
+        pings the server num_pings times and returns the updated clock estimate
+        (see ClockSync.estimate), calling it between runs keeps tracking the drift
+        over long sessions
+        '''
+        for _ in range(num_pings):
+            try:
+                t1 = time.time()
+                reply = self._send_request({ "command": PING })
+                t4 = time.time()
+            except (ConnectionError, OSError) as err:
+                self._reconnect(err)
+                continue
+
+            self.clock_sync.add_exchange(t1, reply["receive_time"], reply["send_time"], t4)
+
+        estimate = self.clock_sync.estimate()
+        if estimate is not None:
+            logging.info(f"Clock offset: {estimate['offset']:.6f} s (+- {estimate['error_bound'] * 1000:.3f} ms), drift: {estimate['drift'] * 1e6:.3f} ppm")
+        return estimate
+
+    def mark(self, name: str, device: Optional[str] = None):
+        '''
+        starts phase `name` of the current run (energy per phase is in the summary of the run),
+        only sends the marker: does not wait for the server
+        '''
+        request = { "command": MARK, "name": name, "client_time": time.time() }
+        if device is not None:
+            request["device"] = device
+
+        try:
+            self._open_session()
+            send_message(self._sock, request)
+        except (ConnectionError, OSError) as err:
+            self._reconnect(err)
+            self.connect()
+            send_message(self._sock, request)
+
+    def req_measurement(self, output_filename: str, device: Optional[str] = None, clock: Optional[dict] = None) -> dict:
+        '''
+        returns once the server has taken the first sample, the reply carries
+        - first_sample_time: timestamp of the first sample (server's perf_counter)
+        - start_latency: time from receiving the request to the first sample (sec)
+        - round_trip_time: time from sending the request to receiving the reply (sec)
+        - devices: device id -> first_sample_time / start_latency of that device
+
+        device: device to measure (default: all devices of the server)
+        clock: clock estimate (see sync_clock) stored in the summary of the run
+        '''
         logging.info("Request to start measuring...")
-        command = f'M_start_{output_filename}'
-        self._req(command)
+        request = { "command": START, "filename": output_filename }
+        if device is not None:
+            request["device"] = device
+        if clock is not None:
+            request["clock"] = clock
+        return self._req(request)
 
-    def stop_measurement(self):
+    def stop_measurement(self, device: Optional[str] = None) -> dict:
+        '''
+        the reply carries
+        - summaries: device id -> { samples, duration [s], energy [J], average_power [W], peak_power [W],
+                                    power: { count, mean, variance, min, max, p50, p95, p99 } [W],
+                                    power_statistics: mergeable form of power (see StreamStatistics.from_dict),
+                                    clock: clock estimate given when starting the run (if any),
+                                    markers: [ { name, time, client_time } ] (if any, see mark),
+                                    phases: [ { name, start, end, samples, duration, energy, average_power, peak_power } ] }
+        - errors: device id -> error that ended its run early (the summary covers what was sampled)
+                  or that stopped its samples / summary from being written (writer_error / summary_error
+                  in the summary), only if any
+        '''
         logging.info("Request to stop measuring...")
-        command = 'M_stop'
-        self._req(command)
+        request = { "command": STOP }
+        if device is not None:
+            request["device"] = device
+        return self._req(request)
+
+    def get_statistics(self, device: Optional[str] = None) -> dict:
+        '''
+        power statistics of the current run so far (or of the last run),
+        the reply carries
+        - statistics: device id -> { count, mean, variance, min, max, p50, p95, p99 } [W]
+        '''
+        request = { "command": STATS }
+        if device is not None:
+            request["device"] = device
+        return self._req(request)
+
+    def subscribe(self) -> Iterator[tuple[str, Optional[str], list[tuple[float, ...]]]]:
+        '''
+        yields (device id, output filename of the current run of that device, batch of samples)
+        while measurements are taken, until the server closes the connection
+
+        device id: the device ids joined with "+" when the server merges their samples
+        '''
+        logging.info("Subscribing to live samples...")
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.connect((self.host, self.port))
+                send_message(s, { "command": SUBSCRIBE })
+                recv_message(s)
+
+                # device id -> output filename of its current run
+                filenames = {}
+                while True:
+                    payload = recv_frame(s)
+                    if payload is None:
+                        break
+
+                    kind = payload[:1]
+                    device_id, offset = sample_frame.decode_device(payload)
+                    if kind == sample_frame.OPEN:
+                        filenames[device_id] = sample_frame.decode_open(payload, offset)["filename"]
+                    elif kind == sample_frame.SAMPLES:
+                        yield device_id, filenames.get(device_id), sample_frame.decode_samples(payload, offset)
+                    elif kind == sample_frame.CLOSE:
+                        filenames.pop(device_id, None)
+        except ConnectionRefusedError:
+            logging.info("Server is not accepting connection yet. Try starting the server and rerun client app.")
+            sys.exit(1)
+
+    def subscribe_with_callback(self, callback: Callable[[str, Optional[str], list[tuple[float, ...]]], None]):
+        '''
+        blocking, calls callback(device id, filename, samples) for every batch of samples
+        '''
+        for device_id, filename, samples in self.subscribe():
+            callback(device_id, filename, samples)
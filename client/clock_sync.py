@@ -0,0 +1,73 @@
+from collections import deque
+from typing import Optional
+
+DEFAULT_MAX_SAMPLES = 256
+
+# only the fastest exchanges are used for the estimate
+# (slow ones are mostly asymmetric queueing delay)
+BEST_FRACTION = 0.5
+
+
+class ClockSync():
+    '''
+    Estimates the offset (and drift) between the clock of this device
+    (time.time(), as used by experiments) and the clock of the server
+    (time.perf_counter() of the supervisor, as used by samples)
+    from NTP-style ping exchanges:
+
+        t1: request sent (client)      t2: request received (server)
+        t4: reply received (client)    t3: reply sent (server)
+
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        delay  = (t4 - t1) - (t3 - t2)
+
+    the true offset is within offset +- delay / 2.
+    '''
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES) -> None:
+        # (client time, offset, delay) of the latest exchanges
+        self.samples = deque(maxlen=max_samples)
+
+    def add_exchange(self, t1: float, t2: float, t3: float, t4: float):
+        offset = ((t2 - t1) + (t3 - t4)) / 2.0
+        delay = (t4 - t1) - (t3 - t2)
+        self.samples.append(((t1 + t4) / 2.0, offset, delay))
+
+    def estimate(self) -> Optional[dict]:
+        '''
+        server time ~= client_time + offset + drift * (client_time - reference_time),
+        within +- error_bound
+        '''
+        if not self.samples:
+            return None
+
+        best = sorted(self.samples, key=lambda sample: sample[2])
+        best = best[:max(1, int(len(best) * BEST_FRACTION))]
+
+        n = len(best)
+        reference_time = sum(t for t, _, _ in best) / n
+        mean_offset = sum(offset for _, offset, _ in best) / n
+
+        # least squares fit of offset over time (needs exchanges spread over time)
+        drift = 0.0
+        spread = sum((t - reference_time) ** 2 for t, _, _ in best)
+        if n > 2 and spread > 1.0:
+            drift = sum((t - reference_time) * (offset - mean_offset) for t, offset, _ in best) / spread
+
+        # half of the fastest round-trip + scatter of the offsets around the fit
+        residual = max(abs(offset - mean_offset - drift * (t - reference_time)) for t, offset, _ in best)
+        error_bound = best[0][2] / 2.0 + residual
+
+        return {
+            "offset": mean_offset,          # sec
+            "drift": drift,                 # sec / sec
+            "reference_time": reference_time,
+            "error_bound": error_bound,     # sec
+            "exchanges": len(self.samples),
+        }
+
+    def to_server_time(self, client_time: float) -> float:
+        estimate = self.estimate()
+        if estimate is None:
+            raise RuntimeError("no clock exchanges yet")
+
+        return client_time + estimate["offset"] + estimate["drift"] * (client_time - estimate["reference_time"])
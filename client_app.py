@@ -43,6 +43,12 @@ def parse_args():
         help="set the number of threads used to run TFLite inference (default: 1)"
     )
 
+    parser.add_argument(
+        "--device_id",
+        default=None,
+        help="set which measuring device of the server measures this DUT (default: all devices of the server)"
+    )
+
     args = parser.parse_args()
 
     return {
@@ -50,6 +56,7 @@ def parse_args():
         "verbose": args.verbose,
         "server_ip": args.server_ip,
         "num_threads": args.num_threads,
+        "device_id": args.device_id,
     }
 
 
@@ -67,6 +74,6 @@ if __name__ == "__main__":
     # NOTE: change the experiment class to your own experiment class
     # experiment = InputZeroRatioExperiment(num_threads=args["num_threads"])
     experiment = SingleCommandExperiment('ls') # NOTE: change the command to your own command
-    assistant = Assistant(client=client, experiment=experiment)
+    assistant = Assistant(client=client, experiment=experiment, device=args["device_id"])
 
     assistant.perform_all_experiments()
@@ -0,0 +1,43 @@
+import argparse
+
+from writer.binary_format import binary_to_csv, csv_to_binary
+from writer.compressed_format import CompressedSink, compressed_to_csv, csv_to_compressed
+from writer.sample_log import LogSink, log_to_csv
+from writer.sink import DEFAULT_TITLES_FILE, read_titles
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="convert sample files between CSV and the binary / compressed formats")
+
+    parser.add_argument(
+        "input",
+        help="file to convert (*.csv -> binary or compressed (output *.pmz), *.pmz / *.pml -> CSV, otherwise binary -> CSV)"
+    )
+
+    parser.add_argument(
+        "output",
+        help="converted file"
+    )
+
+    parser.add_argument(
+        "--titles_file",
+        default=DEFAULT_TITLES_FILE,
+        help=f"json file with the titles of the CSV columns, used for CSV -> binary (default: {DEFAULT_TITLES_FILE})"
+    )
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.input.endswith(".csv"):
+        titles = read_titles(args.titles_file)
+        if args.output.endswith(CompressedSink.extension):
+            csv_to_compressed(args.input, args.output, titles)
+        else:
+            csv_to_binary(args.input, args.output, titles)
+    elif args.input.endswith(CompressedSink.extension):
+        compressed_to_csv(args.input, args.output)
+    elif args.input.endswith(LogSink.extension):
+        log_to_csv(args.input, args.output)
+    else:
+        binary_to_csv(args.input, args.output)
@@ -1,3 +1,4 @@
+import time
 from abc import ABC, abstractmethod
 
 class DeviceController(ABC):
@@ -68,3 +69,16 @@ class DeviceController(ABC):
     @abstractmethod
     def is_meter_ready(self) -> bool:
         pass
+
+    def get_timed_values(self) -> tuple[tuple[float, ...], tuple[tuple[float, float], ...]]:
+        '''
+        values (see get_values) and (start, end) perf_counter of the query of each value
+
+        default: all values come from one query
+        (override when the values are read by separate queries)
+        '''
+        start_time = time.perf_counter()
+        values = self.get_values()
+        end_time = time.perf_counter()
+
+        return values, ((start_time, end_time),) * len(values)
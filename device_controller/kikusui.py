@@ -14,11 +14,12 @@ import json
 import logging
 import os
 import sys
+import time
 from inspect import getfile
-from typing import cast
+from typing import Optional, cast
 
 import pyvisa
-from pyvisa.resources.usb import USBInstrument
+from pyvisa.resources import MessageBasedResource
 from usb.core import USBError
 
 from device_controller.device_controller import DeviceController
@@ -26,9 +27,20 @@ from device_controller.device_info import device_addr
 
 
 class Kikusui(DeviceController):
-    def __init__(self, device_id: str) -> None:
+    def __init__(self, device_id: Optional[str] = None, combined_query: bool = True, address: Optional[str] = None) -> None:
         super().__init__()
 
+        # combined_query = True -> MEAS:CURR? and MEAS:VOLT? are sent as one
+        # compound SCPI message (1 USB-TMC round-trip per sample).
+        # falls back to separate queries if the meter rejects the compound form
+        # (probed once when connecting, see _probe_combined_query).
+        self._combined_query = combined_query
+
+        # per-sample query latency (sec) of get_values() / get_timed_values()
+        self._num_queries = 0
+        self._total_query_latency = 0.0
+        self._max_query_latency = 0.0
+
         # look for parameters for sampler (json)
         param_file = f"{os.path.splitext(getfile(Kikusui))[0]}.json"
         # try to load parameters from json file
@@ -49,17 +61,27 @@ class Kikusui(DeviceController):
         self._rm = pyvisa.ResourceManager('@py')
 
         # try to open resource (connect to device)
-        self._address = device_addr[device_id]
+        # address: any VISA resource string, e.g. the emulator (see device_controller/pmx_emulator.py)
+        #          "TCPIP0::127.0.0.1::5025::SOCKET", otherwise the USB address of device_id
+        if address is None:
+            if device_id not in device_addr:
+                logging.info(f"Unknown device id: {device_id}, choose from {list(device_addr)} or give its address")
+                sys.exit(1)
+            address = device_addr[device_id]
+        self._address = address
 
         try:
-            # cast to make sure that meter is an instrument connected via USB
-            self._meter = cast(USBInstrument, self._rm.open_resource(self._address))
+            # cast to make sure that meter is a message based instrument (USB or TCPIP socket)
+            self._meter = cast(MessageBasedResource, self._rm.open_resource(self._address))
 
             # set termination for commands (differ between devices)
             self._meter.read_termination = '\n'
             self._meter.write_termination = '\n'
 
             logging.debug(f"*IDN?: {self._query('*IDN?')}")
+
+            if self._combined_query:
+                self._probe_combined_query()
         except USBError as err:
             self._meter = None
             logging.info(f"USBERror: {err}")
@@ -68,12 +90,20 @@ class Kikusui(DeviceController):
             self._meter = None
             logging.info(f"ValueError: {err}")
             sys.exit(1)
+        except pyvisa.errors.VisaIOError as err:
+            self._meter = None
+            logging.info(f"VisaIOError: {err}")
+            sys.exit(1)
             
 
     def close(self):
         assert self._rm is not None
         assert self._meter is not None
 
+        if self._num_queries > 0:
+            mode = "combined" if self._combined_query else "separate"
+            logging.info(f"Query latency ({mode}): mean {self.get_query_latency() * 1000:.3f} ms, max {self._max_query_latency * 1000:.3f} ms over {self._num_queries} samples")
+
         self._meter.close()
         self._meter = None
         self._rm.close()
@@ -125,11 +155,82 @@ class Kikusui(DeviceController):
     def get_titles(self):
         return self._titles
 
+    def _get_values_combined(self) -> tuple[float, float]:
+        '''
+        one compound message, reply: "<current>;<voltage>"
+        '''
+        command = "MEAS:CURR?;:MEAS:VOLT?"
+        reply = self._query(command).split(';')
+        if len(reply) != 2:
+            raise ValueError(f"unexpected reply to {command}: {reply}")
+
+        return ( float(reply[0]), float(reply[1]) )
+
+    def _probe_combined_query(self):
+        '''
+        sends the compound query once: if it fails and the meter reports an error
+        (e.g. -1xx command error, -440 query unterminated), separate queries are used.
+        a failure without error (e.g. I/O timeout) is not a rejection, it is raised
+        '''
+        assert self._meter is not None
+
+        try:
+            self._get_values_combined()
+        except (pyvisa.errors.VisaIOError, ValueError) as err:
+            # discard partial reply
+            self._meter.clear()
+            error = self._query("SYST:ERR?")
+            if error.split(",")[0].strip() in ("0", "+0"):
+                raise
+
+            logging.info(f"Compound query rejected ({err}, {error}), falling back to separate queries")
+            self._combined_query = False
+            # clear the error queue
+            self._write("*CLS")
+
     def get_values(self) -> tuple[float, float]:
         '''
         [ current, voltage ]
         '''
-        return ( self.get_current(), self.get_voltage() )
+        start_time = time.perf_counter()
+
+        # errors (e.g. timeout) end the run (see Sampler), the query form is kept
+        if self._combined_query:
+            values = self._get_values_combined()
+        else:
+            values = ( self.get_current(), self.get_voltage() )
+
+        self._add_query_latency(time.perf_counter() - start_time)
+
+        return values
+
+    def get_timed_values(self) -> tuple[tuple[float, ...], tuple[tuple[float, float], ...]]:
+        if self._combined_query:
+            return super().get_timed_values()
+
+        start_time = time.perf_counter()
+        current = self.get_current()
+        current_time = time.perf_counter()
+        voltage = self.get_voltage()
+        end_time = time.perf_counter()
+
+        self._add_query_latency(end_time - start_time)
+
+        return ( current, voltage ), ( (start_time, current_time), (current_time, end_time) )
+
+    def _add_query_latency(self, latency: float):
+        self._num_queries += 1
+        self._total_query_latency += latency
+        self._max_query_latency = max(self._max_query_latency, latency)
+
+    def get_query_latency(self) -> float:
+        '''
+        mean latency (sec) of get_values() / get_timed_values() so far
+        '''
+        if self._num_queries == 0:
+            return 0.0
+
+        return self._total_query_latency / self._num_queries
 
     def is_meter_ready(self) -> bool:
         return self._meter != None
@@ -0,0 +1,234 @@
+# Emulates the subset of the remote commands of a Kikusui PMX power supply
+# used by device_controller/kikusui.py, over a raw TCP socket (SCPI lines terminated by '\n'),
+# so that Kikusui can be run without hardware through pyvisa:
+#
+#   Kikusui(address="TCPIP0::127.0.0.1::5025::SOCKET")
+#
+# Supported (case insensitive, compound messages separated by ';'):
+#
+#   *IDN?  *RST  *CLS  RST  STAT:PRES  SYST:ERR?
+#   CURR <val>  CURR?  VOLT <val>  VOLT?  OUTP <0|1|ON|OFF>  OUTP?
+#   MEAS:CURR?  MEAS:VOLT?
+#
+# Unknown commands are queued as errors (SYST:ERR?) and get no reply
+# (a query in the same message times out, like on the real supply).
+
+import logging
+import math
+import random
+import socketserver
+import threading
+import time
+from typing import Optional
+
+DEFAULT_PORT = 5025
+IDN = "KIKUSUI,PMX18-5A,EMULATOR,1.00"
+
+# shape of the current drawn by the emulated load over time
+CONSTANT = "constant"
+SINE = "sine"
+SQUARE = "square"
+SAWTOOTH = "sawtooth"
+WAVEFORMS = (CONSTANT, SINE, SQUARE, SAWTOOTH)
+
+
+class PmxState():
+    '''
+    settings of the emulated supply and the load connected to it
+    '''
+    def __init__(
+        self,
+        waveform: str = CONSTANT,
+        load_current: float = 1.0,
+        amplitude: float = 0.5,
+        period: float = 1.0,
+        noise: float = 0.01,
+        compound_queries: bool = True,
+    ) -> None:
+        if waveform not in WAVEFORMS:
+            raise ValueError(f"waveform must be one of {WAVEFORMS}, got {waveform}")
+
+        # load: load_current + amplitude * waveform(t / period) [A] (+ gaussian noise)
+        self.waveform = waveform
+        self.load_current = load_current
+        self.amplitude = amplitude
+        self.period = period
+        self.noise = noise
+        # False -> several queries in one message are rejected (Kikusui falls back to separate queries)
+        self.compound_queries = compound_queries
+
+        self._lock = threading.Lock()
+        self._start_time = time.perf_counter()
+        self.reset()
+
+    def reset(self):
+        self.current_limit = 5.0 # A
+        self.voltage = 0.0 # V
+        self.output = False
+        self.errors = []
+
+    def add_error(self, error: str):
+        '''
+        queues an error of a message rejected as a whole (can be called from any connection)
+        '''
+        with self._lock:
+            self.errors.append(error)
+
+    def _shape(self, t: float) -> float:
+        phase = (t / self.period) % 1.0
+        if self.waveform == SINE:
+            return math.sin(2 * math.pi * phase)
+        if self.waveform == SQUARE:
+            return 1.0 if phase < 0.5 else -1.0
+        if self.waveform == SAWTOOTH:
+            return 2.0 * phase - 1.0
+        return 0.0
+
+    def measure_current(self) -> float:
+        if not self.output:
+            return 0.0
+
+        t = time.perf_counter() - self._start_time
+        current = self.load_current + self.amplitude * self._shape(t) + random.gauss(0.0, self.noise)
+        # constant current mode beyond the limit
+        return min(max(current, 0.0), self.current_limit)
+
+    def measure_voltage(self) -> float:
+        if not self.output:
+            return 0.0
+
+        return max(self.voltage + random.gauss(0.0, self.noise * 0.1), 0.0)
+
+    def execute(self, command: str) -> Optional[str]:
+        '''
+        one SCPI command (without ';'), returns the reply of a query (None for other commands)
+        '''
+        header, _, argument = command.strip().partition(" ")
+        header = header.upper().lstrip(":")
+        argument = argument.strip()
+
+        with self._lock:
+            if header == "*IDN?":
+                return IDN
+            if header in ("*RST", "RST"):
+                self.reset()
+                return None
+            if header == "*CLS":
+                self.errors = []
+                return None
+            if header in ("STAT:PRES", "STATUS:PRESET"):
+                return None
+            if header in ("SYST:ERR?", "SYSTEM:ERROR?"):
+                return self.errors.pop(0) if self.errors else '0,"No error"'
+
+            if header in ("MEAS:CURR?", "MEASURE:CURRENT?"):
+                return f"{self.measure_current():.4f}"
+            if header in ("MEAS:VOLT?", "MEASURE:VOLTAGE?"):
+                return f"{self.measure_voltage():.4f}"
+
+            try:
+                if header in ("CURR", "CURRENT"):
+                    self.current_limit = float(argument)
+                    return None
+                if header in ("VOLT", "VOLTAGE"):
+                    self.voltage = float(argument)
+                    return None
+                if header in ("OUTP", "OUTPUT"):
+                    if argument.upper() not in ("0", "1", "ON", "OFF"):
+                        raise ValueError(argument)
+                    self.output = argument.upper() in ("1", "ON")
+                    return None
+            except ValueError:
+                self.errors.append(f'-224,"Illegal parameter value: {command}"')
+                raise
+
+            if header in ("CURR?", "CURRENT?"):
+                return f"{self.current_limit:.4f}"
+            if header in ("VOLT?", "VOLTAGE?"):
+                return f"{self.voltage:.4f}"
+            if header in ("OUTP?", "OUTPUT?"):
+                return "1" if self.output else "0"
+
+            self.errors.append(f'-113,"Undefined header: {command}"')
+            raise ValueError(command)
+
+
+class _PmxHandler(socketserver.StreamRequestHandler):
+    # set by PmxEmulator
+    state: PmxState
+    latency: float
+    jitter: float
+
+    def handle(self):
+        logging.info(f"Emulator connected by: {self.client_address}")
+        for line in self.rfile:
+            message = line.decode('ascii', errors='replace').strip()
+            if not message:
+                continue
+            logging.debug(f"Emulator received: {message}")
+
+            commands = message.split(";")
+            if not self.state.compound_queries and sum(command.strip().endswith("?") for command in commands) > 1:
+                self.state.add_error(f'-440,"Query unterminated after indefinite response: {message}"')
+                continue
+
+            replies = []
+            try:
+                for command in commands:
+                    reply = self.state.execute(command)
+                    if reply is not None:
+                        replies.append(reply)
+            except ValueError:
+                # error queued, nothing is sent back for this message
+                continue
+
+            if replies:
+                delay = self.latency + random.uniform(0.0, self.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+                self.wfile.write(f"{';'.join(replies)}\n".encode('ascii'))
+
+        logging.info(f"Emulator disconnected: {self.client_address}")
+
+
+class _PmxServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class PmxEmulator():
+    '''
+    serves the emulated supply on host:port (one thread per connection),
+    every reply is delayed by latency + uniform(0, jitter) seconds
+    '''
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, latency: float = 0.0, jitter: float = 0.0, state: Optional[PmxState] = None) -> None:
+        self.state = state if state is not None else PmxState()
+
+        handler = type("PmxHandler", (_PmxHandler,), { "state": self.state, "latency": latency, "jitter": jitter })
+        self._server = _PmxServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        '''
+        VISA resource string to connect to the emulator
+        '''
+        host, port = self._server.server_address[:2]
+        return f"TCPIP0::{host}::{port}::SOCKET"
+
+    def serve_forever(self):
+        logging.info(f"Emulating PMX on {self.address}")
+        self._server.serve_forever()
+
+    def start(self):
+        '''
+        serves on a background thread
+        '''
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
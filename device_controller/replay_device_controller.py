@@ -0,0 +1,150 @@
+import logging
+import time
+from typing import Iterator, Optional
+
+from device_controller.demo_device_controller import DemoDeviceController
+from writer.binary_format import BinaryReader
+from writer.compressed_format import CompressedReader, CompressedSink
+from writer.sample_log import LogSink, read_log, read_log_titles
+from writer.sink import read_csv, read_titles
+
+# speed: as fast as possible (no waiting between records)
+AS_FAST_AS_POSSIBLE = 0.0
+
+# when a record is due more than this (sec) in the past (e.g. the replay was idle between runs),
+# the replay restarts its timing from that record instead of catching up with a burst
+MAX_LAG = 1.0
+
+
+def read_trace(filename: str, titles: Optional[tuple[str, ...]] = None) -> tuple[tuple[str, ...], Iterator[tuple[float, ...]]]:
+    '''
+    titles and records of a sample file of any output format (.csv, .bin, .pmz, .pml),
+    CSV files have no title row: titles (default: the ones of writer/sink.py DEFAULT_TITLES_FILE)
+    '''
+    if filename.endswith(".csv"):
+        if titles is None:
+            titles = read_titles()
+        return tuple(titles), read_csv(filename)
+
+    if filename.endswith(CompressedSink.extension):
+        reader = CompressedReader(filename)
+        return reader.titles, iter(reader)
+
+    if filename.endswith(LogSink.extension):
+        return read_log_titles(filename), read_log(filename)
+
+    reader = BinaryReader(filename)
+    return reader.titles, iter(reader)
+
+
+class ReplayDeviceController(DemoDeviceController):
+    '''
+    Replays the current / voltage of a recorded sample file
+    (e.g. to stress the writer and the statistics with a real trace, or to reproduce a run).
+
+    Every get_values() returns the next record of the file, waiting until it is due:
+    the gaps between the timestamps of the records divided by speed
+    (1.0: original timing, 10.0: 10 times faster, AS_FAST_AS_POSSIBLE: no waiting).
+    Sample with a sampling interval shorter than the one of the trace,
+    so the replay (not the sampler) sets the pace.
+
+    The sequence of values does not depend on the timing (deterministic),
+    at the end of the file the replay starts over (loop) or repeats the last record.
+
+    columns: titles of the replayed values (default: the first two value columns of the file)
+    '''
+    def __init__(
+        self,
+        filename: str,
+        speed: float = 1.0,
+        loop: bool = False,
+        titles: Optional[tuple[str, ...]] = None,
+        columns: Optional[tuple[str, str]] = None,
+    ) -> None:
+        super().__init__()
+
+        if speed < 0:
+            raise ValueError(f"speed must not be negative, got {speed}")
+
+        self.filename = filename
+        self.speed = speed
+        self.loop = loop
+        self._csv_titles = titles
+
+        file_titles, self._records = read_trace(filename, titles)
+        columns = tuple(columns) if columns is not None else file_titles[1:3]
+        missing = [ column for column in columns if column not in file_titles ]
+        if missing:
+            raise ValueError(f"{filename}: no column {missing} in {file_titles}")
+        self._indexes = tuple(file_titles.index(column) for column in columns)
+        self._titles = ( file_titles[0], *columns )
+
+        # values of the last record returned
+        self._values = None
+        # replay timing: perf_counter when the trace timestamp trace_start is due
+        self._start = None
+        self._trace_start = None
+
+        self.num_records = 0
+        self.num_loops = 0
+        self.finished = False
+
+    def close(self):
+        logging.debug(f"Closing ReplayDeviceController ({self.num_records} records replayed)")
+
+    def rewind(self):
+        '''
+        replays the file from its first record again
+        '''
+        _, self._records = read_trace(self.filename, self._csv_titles)
+        self._start = None
+        self.finished = False
+
+    def _next_record(self) -> Optional[tuple[float, ...]]:
+        record = next(self._records, None)
+        if record is None and self.loop:
+            self.rewind()
+            self.num_loops += 1
+            record = next(self._records, None)
+
+        if record is None and not self.finished:
+            logging.info(f"Replay of {self.filename} finished after {self.num_records} records")
+            self.finished = True
+
+        return record
+
+    def _wait_until_due(self, timestamp: float):
+        now = time.perf_counter()
+        if self._start is None:
+            self._start, self._trace_start = now, timestamp
+            return
+
+        due = self._start + (timestamp - self._trace_start) / self.speed
+        if due > now:
+            time.sleep(due - now)
+        elif now - due > MAX_LAG:
+            self._start, self._trace_start = now, timestamp
+
+    def get_values(self) -> tuple[float, float]:
+        record = self._next_record()
+        if record is not None:
+            if self.speed != AS_FAST_AS_POSSIBLE:
+                self._wait_until_due(record[0])
+            self._values = tuple(record[i] for i in self._indexes)
+            self.num_records += 1
+        elif self._values is None:
+            raise ValueError(f"{self.filename}: no records to replay")
+
+        return self._values
+
+    def get_current(self) -> float:
+        '''
+        current of the last record replayed (see get_values)
+        '''
+        return self._values[0] if self._values is not None else self.get_values()[0]
+
+    def get_voltage(self) -> float:
+        '''
+        voltage of the last record replayed (see get_values)
+        '''
+        return self._values[1] if self._values is not None else self.get_values()[1]
@@ -0,0 +1,56 @@
+import random
+import time
+
+from device_controller.demo_device_controller import DemoDeviceController
+
+
+class SimulatedDeviceController(DemoDeviceController):
+    '''
+    DemoDeviceController whose queries take time like a real instrument:
+    every query waits query_latency + uniform(0, query_jitter) seconds
+    (sleeping, i.e. without holding the GIL, like waiting for I/O).
+
+    combined_query: current and voltage in one query (one latency per sample),
+    otherwise one query each (see Kikusui)
+    '''
+    def __init__(self, query_latency: float = 0.0, query_jitter: float = 0.0, combined_query: bool = True) -> None:
+        super().__init__()
+
+        self.query_latency = query_latency
+        self.query_jitter = query_jitter
+        self.combined_query = combined_query
+
+        self.num_queries = 0
+
+    def _wait_for_reply(self):
+        self.num_queries += 1
+        delay = self.query_latency + random.uniform(0.0, self.query_jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def get_current(self) -> float:
+        self._wait_for_reply()
+        return super().get_current()
+
+    def get_voltage(self) -> float:
+        self._wait_for_reply()
+        return super().get_voltage()
+
+    def get_values(self) -> tuple[float, float]:
+        if self.combined_query:
+            self._wait_for_reply()
+            return ( super().get_current(), super().get_voltage() )
+
+        return ( self.get_current(), self.get_voltage() )
+
+    def get_timed_values(self) -> tuple[tuple[float, ...], tuple[tuple[float, float], ...]]:
+        if self.combined_query:
+            return super().get_timed_values()
+
+        start_time = time.perf_counter()
+        current = self.get_current()
+        current_time = time.perf_counter()
+        voltage = self.get_voltage()
+        end_time = time.perf_counter()
+
+        return ( current, voltage ), ( (start_time, current_time), (current_time, end_time) )
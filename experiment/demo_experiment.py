@@ -23,7 +23,11 @@ class DemoExperiment(Experiment):
     
     def run(self):
         logging.info(f"Sleeping for {self.next_i} s...")
-        time.sleep(self.next_i)
+        # two phases, with their own energy in the summary of the run
+        self.mark("first_half")
+        time.sleep(self.next_i / 2)
+        self.mark("second_half")
+        time.sleep(self.next_i / 2)
         self.next_i += 1
 
     def after_run(self):
@@ -1,7 +1,23 @@
 from abc import ABC, abstractmethod
+from typing import Callable, Optional
 
 
 class Experiment(ABC):
+    # set by the assistant performing the experiment (see mark)
+    _marker = None
+
+    def set_marker(self, marker: Optional[Callable[[str], None]]):
+        self._marker = marker
+
+    def mark(self, name: str):
+        '''
+        can be called in run() to start a new phase of the measurement
+        (e.g. "load", "warmup", "inference"), the energy of every phase is
+        in the summary of the run
+        '''
+        if self._marker is not None:
+            self._marker(name)
+
     @abstractmethod
     def get_output_filename(self) -> str:
         '''
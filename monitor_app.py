@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import argparse
+from logging import DEBUG, INFO
+
+from client.client import Client
+from utils.utils import enable_logging
+
+LOCALHOST = "127.0.0.1"
+
+PORT = 65432
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="print live power measurements of the server")
+
+    parser.add_argument(
+        "-V",
+        "--verbose",
+        action="store_true",
+        default=False,
+        help="set -V to get more detailed logs (default: False)"
+    )
+
+    parser.add_argument(
+        "--server_ip",
+        default=LOCALHOST,
+        help="specify the server's ip addr"
+    )
+
+    args = parser.parse_args()
+
+    return {
+        "verbose": args.verbose,
+        "server_ip": args.server_ip,
+    }
+
+
+def print_samples(device_id, filename, samples):
+    # [ epoch, current, voltage ]
+    for sample in samples:
+        print(f"{device_id}\t{filename}\t{sample[0]:.6f}\t{sample[1] * sample[2]:.4f} W")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    log_level = DEBUG if args["verbose"] else INFO
+    enable_logging(level=log_level)
+
+    client = Client(host=args["server_ip"], port=PORT)
+    client.subscribe_with_callback(print_samples)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import argparse
+from logging import DEBUG, INFO
+
+from device_controller.pmx_emulator import CONSTANT, DEFAULT_PORT, WAVEFORMS, PmxEmulator, PmxState
+from utils.utils import enable_logging
+
+LOCALHOST = "127.0.0.1"
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="emulate a Kikusui PMX power supply on a TCP socket, "
+                    "e.g. python3 server_app.py --address TCPIP0::127.0.0.1::5025::SOCKET"
+    )
+
+    parser.add_argument(
+        "-V",
+        "--verbose",
+        action="store_true",
+        default=False,
+        help="set -V to get more detailed logs (default: False)"
+    )
+
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"set the port to listen on (default: {DEFAULT_PORT})"
+    )
+
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="set the delay of every reply in seconds (default: 0 s)"
+    )
+
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="set the jitter (uniform, added to the latency) of every reply in seconds (default: 0 s)"
+    )
+
+    parser.add_argument(
+        "--waveform",
+        choices=WAVEFORMS,
+        default=CONSTANT,
+        help=f"set the shape of the current drawn by the emulated load (default: {CONSTANT})"
+    )
+
+    parser.add_argument(
+        "--load_current",
+        type=float,
+        default=1.0,
+        help="set the mean current drawn by the emulated load in ampere (default: 1.0 A)"
+    )
+
+    parser.add_argument(
+        "--amplitude",
+        type=float,
+        default=0.5,
+        help="set the amplitude of the waveform in ampere (default: 0.5 A)"
+    )
+
+    parser.add_argument(
+        "--period",
+        type=float,
+        default=1.0,
+        help="set the period of the waveform in seconds (default: 1.0 s)"
+    )
+
+    parser.add_argument(
+        "--noise",
+        type=float,
+        default=0.01,
+        help="set the standard deviation of the measurement noise in ampere (default: 0.01 A)"
+    )
+
+    parser.add_argument(
+        "--reject_compound",
+        action="store_true",
+        default=False,
+        help="set --reject_compound to reject several queries in one message (default: False)"
+    )
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    log_level = DEBUG if args.verbose else INFO
+    enable_logging(level=log_level)
+
+    state = PmxState(
+        waveform=args.waveform,
+        load_current=args.load_current,
+        amplitude=args.amplitude,
+        period=args.period,
+        noise=args.noise,
+        compound_queries=not args.reject_compound,
+    )
+    emulator = PmxEmulator(host=LOCALHOST, port=args.port, latency=args.latency, jitter=args.jitter, state=state)
+
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import socket
+import struct
+from typing import Optional
+
+# every message is sent as a frame: | length (uint32, network order) | payload |
+_LENGTH = struct.Struct("!I")
+
+# requests and replies are JSON objects (utf-8) in one frame each
+#
+#   request: { "command": <command>, "id": int (optional), ...arguments }
+#   reply:   { "ok": true, ...results } or { "ok": false, "error": str },
+#            with the id of the request (if any): a client can tell which request a reply answers
+START = "M_start"           # arguments: filename, device (optional, default: all devices),
+                            #            clock (optional, stored with the run, see client/clock_sync.py)
+STOP = "M_stop"             # arguments: device (optional, default: all devices)
+                            # reply: summaries (device id -> energy / power summary of the run)
+STATS = "M_stats"           # arguments: device (optional, default: all devices)
+                            # reply: statistics (device id -> power statistics of the current / last run)
+SUBSCRIBE = "M_subscribe"   # after the reply, the server pushes sample frames (see sample_frame.py)
+MARK = "M_mark"             # arguments: name, client_time (time.time() of the client), device (optional)
+                            # no reply: the client does not wait for a round-trip
+PING = "M_ping"             # reply: receive_time, send_time (server's perf_counter), for clock synchronization
+
+# command -> arguments it requires and their types
+_REQUIRED_ARGUMENTS = {
+    START: { "filename": str },
+    MARK: { "name": str },
+}
+# types of the optional arguments (None: not given)
+_OPTIONAL_ARGUMENTS = {
+    "id": int,
+    "device": str,
+    "clock": dict,
+    "client_time": (int, float),
+}
+
+MAX_FRAME_SIZE = 16 * 1024 * 1024 # bytes
+
+
+def validate_request(request) -> Optional[str]:
+    '''
+    returns why the request is malformed (None: it is well-formed)
+    '''
+    if not isinstance(request, dict):
+        return f"request must be a JSON object, got {type(request).__name__}"
+
+    command = request.get("command")
+    for name, kind in _REQUIRED_ARGUMENTS.get(command, {}).items():
+        if name not in request:
+            return f"{command}: missing argument {name}"
+        if not isinstance(request[name], kind):
+            return f"{command}: {name} must be a {kind.__name__}, got {type(request[name]).__name__}"
+
+    for name, kind in _OPTIONAL_ARGUMENTS.items():
+        value = request.get(name)
+        if value is not None and not isinstance(value, kind):
+            return f"{command}: unexpected type of {name}: {type(value).__name__}"
+
+    return None
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def send_frame(sock: socket.socket, payload: bytes):
+    sock.sendall(encode_frame(payload))
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("connection closed in the middle of a frame")
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Optional[bytes]:
+    '''
+    returns None when the peer closed the connection between frames
+    '''
+    header = sock.recv(_LENGTH.size)
+    if not header:
+        return None
+    if len(header) < _LENGTH.size:
+        header += _recv_exactly(sock, _LENGTH.size - len(header))
+
+    (length,) = _LENGTH.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ConnectionError(f"frame too large: {length} bytes")
+
+    return _recv_exactly(sock, length)
+
+
+def send_message(sock: socket.socket, message: dict):
+    send_frame(sock, json.dumps(message).encode('utf-8'))
+
+
+def recv_message(sock: socket.socket) -> Optional[dict]:
+    '''
+    returns None when the peer closed the connection between messages
+    '''
+    payload = recv_frame(sock)
+    if payload is None:
+        return None
+
+    return json.loads(payload.decode('utf-8'))
+
+
+async def send_message_async(writer: asyncio.StreamWriter, message: dict):
+    writer.write(encode_frame(json.dumps(message).encode('utf-8')))
+    await writer.drain()
+
+
+async def recv_message_async(reader: asyncio.StreamReader) -> Optional[dict]:
+    '''
+    returns None when the peer closed the connection between messages
+    '''
+    try:
+        header = await reader.readexactly(_LENGTH.size)
+    except asyncio.IncompleteReadError as err:
+        if not err.partial:
+            return None
+        raise ConnectionError("connection closed in the middle of a frame")
+
+    (length,) = _LENGTH.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ConnectionError(f"frame too large: {length} bytes")
+
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("connection closed in the middle of a frame")
+
+    return json.loads(payload.decode('utf-8'))
@@ -0,0 +1,66 @@
+# Payloads of the frames pushed to subscribers (see server/subscriber.py)
+#
+#   | kind | device id                 | rest of the payload                                         |
+#   | ---  | ---                       | ---                                                         |
+#   | b"O" | length (uint8), utf-8 str | a run started: JSON {"filename": str, "titles": [str, ...]} |
+#   | b"S" | length (uint8), utf-8 str | samples: number of columns (uint16), number of records      |
+#   |      |                           | (uint32), then the records as float64 (little endian),      |
+#   |      |                           | row by row                                                  |
+#   | b"C" | length (uint8), utf-8 str | the run ended                                               |
+#
+# device id: the device whose writer sent the frame,
+# the device ids joined with "+" for a writer shared by several devices (merged output)
+
+import json
+import struct
+
+OPEN = b"O"
+SAMPLES = b"S"
+CLOSE = b"C"
+
+_DEVICE_LENGTH = struct.Struct("<B")
+_SAMPLES_HEADER = struct.Struct("<HI")
+
+
+def _encode_device(device_id: str) -> bytes:
+    encoded = device_id.encode('utf-8')
+    if len(encoded) > 255:
+        raise ValueError(f"device id too long: {device_id}")
+
+    return _DEVICE_LENGTH.pack(len(encoded)) + encoded
+
+
+def encode_open(device_id: str, filename: str, titles: tuple[str, ...]) -> bytes:
+    return OPEN + _encode_device(device_id) + json.dumps({ "filename": filename, "titles": list(titles) }).encode('utf-8')
+
+
+def encode_samples(device_id: str, records: list[tuple[float, ...]]) -> bytes:
+    num_columns = len(records[0]) if records else 0
+    values = [ value for record in records for value in record ]
+
+    return SAMPLES + _encode_device(device_id) + _SAMPLES_HEADER.pack(num_columns, len(records)) + struct.pack(f"<{len(values)}d", *values)
+
+
+def encode_close(device_id: str) -> bytes:
+    return CLOSE + _encode_device(device_id)
+
+
+def decode_device(payload: bytes) -> tuple[str, int]:
+    '''
+    returns (device id, offset of the rest of the payload)
+    '''
+    (length,) = _DEVICE_LENGTH.unpack_from(payload, 1)
+    offset = 1 + _DEVICE_LENGTH.size + length
+
+    return payload[1 + _DEVICE_LENGTH.size:offset].decode('utf-8'), offset
+
+
+def decode_open(payload: bytes, offset: int) -> dict:
+    return json.loads(payload[offset:].decode('utf-8'))
+
+
+def decode_samples(payload: bytes, offset: int) -> list[tuple[float, ...]]:
+    num_columns, num_records = _SAMPLES_HEADER.unpack_from(payload, offset)
+    values = struct.unpack_from(f"<{num_columns * num_records}d", payload, offset + _SAMPLES_HEADER.size)
+
+    return [ values[i:i + num_columns] for i in range(0, len(values), num_columns) ]
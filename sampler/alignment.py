@@ -0,0 +1,62 @@
+from typing import Optional
+
+
+def channel_time_titles(titles: tuple[str, ...]) -> tuple[str, ...]:
+    '''
+    titles of the query start / end columns of every channel (all titles but the timestamp)
+    '''
+    return tuple(f"{title} {edge}" for title in titles[1:] for edge in ("query start", "query end"))
+
+
+class ChannelAligner():
+    '''
+    Interpolates the channels of a sample (e.g. current and voltage, read one after
+    the other) onto one instant: the timestamp of the sample, taken before any query.
+
+    Every channel is read at the midpoint of its query, so the timestamp of sample k
+    lies between the readings of a channel in samples k - 1 and k:
+    the channel is interpolated linearly between these two readings
+    (no delay: the aligned sample is ready as soon as sample k is taken).
+    '''
+    def __init__(self) -> None:
+        # (time, value) of every channel in the previous sample
+        self._previous = None
+
+    def align(self, timestamp: float, values: tuple[float, ...], channel_times: tuple[tuple[float, float], ...]) -> tuple[float, ...]:
+        '''
+        channel_times: (query start, query end) of every channel
+        returns the values of the channels at timestamp
+        '''
+        readings = [ ((start + end) / 2.0, value) for value, (start, end) in zip(values, channel_times) ]
+        previous, self._previous = self._previous, readings
+
+        # first sample: nothing to interpolate with
+        if previous is None:
+            return tuple(values)
+
+        aligned = []
+        for (previous_time, previous_value), (time, value) in zip(previous, readings):
+            if time <= previous_time:
+                aligned.append(value)
+                continue
+            aligned.append(previous_value + (value - previous_value) * (timestamp - previous_time) / (time - previous_time))
+
+        return tuple(aligned)
+
+
+def align_records(records: list[tuple[float, ...]], num_channels: Optional[int] = None) -> list[tuple[float, ...]]:
+    '''
+    aligned ( timestamp, channel 1, channel 2, ... ) of records
+    recorded with channel timestamps (see Sampler(channel_timestamps=True)):
+        ( timestamp, channel 1, ..., channel n, channel 1 query start, channel 1 query end, ... )
+    '''
+    aligner = ChannelAligner()
+    aligned = []
+    for record in records:
+        n = num_channels if num_channels is not None else (len(record) - 1) // 3
+        values = record[1:1 + n]
+        times = record[1 + n:1 + 3 * n]
+        channel_times = tuple(zip(times[0::2], times[1::2]))
+        aligned.append(( record[0], *aligner.align(record[0], values, channel_times) ))
+
+    return aligned
@@ -0,0 +1,153 @@
+import json
+import os
+from collections import deque
+from typing import Optional
+
+
+class EnergyIntegrator():
+    '''
+    Integrates power (V * I) over the timestamps of the samples
+    (trapezoidal rule), one sample at a time while a run is in progress.
+    '''
+    def __init__(self) -> None:
+        self.num_samples = 0
+        self.energy = 0.0 # J
+        self.peak_power = 0.0 # W
+
+        self.first_time = None
+        self._last_time = None
+        self._last_power = None
+
+    def add(self, timestamp: float, current: float, voltage: float):
+        power = current * voltage
+
+        if self._last_time is None:
+            self.first_time = timestamp
+            self.peak_power = power
+        else:
+            self.energy += (self._last_power + power) / 2.0 * (timestamp - self._last_time)
+            self.peak_power = max(self.peak_power, power)
+
+        self._last_time = timestamp
+        self._last_power = power
+        self.num_samples += 1
+
+    def get_summary(self) -> dict:
+        duration = 0.0
+        if self.num_samples > 1:
+            duration = self._last_time - self.first_time
+
+        if duration > 0:
+            average_power = self.energy / duration
+        else:
+            average_power = self._last_power if self._last_power is not None else 0.0
+
+        return {
+            "samples": self.num_samples,
+            "duration": duration,             # sec
+            "energy": self.energy,            # J
+            "average_power": average_power,   # W
+            "peak_power": self.peak_power,    # W
+        }
+
+
+def summary_filename(filename: str) -> str:
+    '''
+    sidecar of a sample file: XXX.csv -> XXX.summary.json
+    '''
+    return f"{os.path.splitext(filename)[0]}.summary.json"
+
+
+def write_summary(filename: str, summary: dict):
+    with open(summary_filename(filename), 'w') as summary_json:
+        json.dump(summary, summary_json, indent=4)
+
+
+class PhaseEnergyIntegrator():
+    '''
+    Splits the energy of a run into phases delimited by named markers.
+
+    Markers can be added from any thread (e.g. the server receiving them from the client),
+    they are applied by the measuring thread when the next sample is added:
+    the trapezoid between the two samples around a marker is split at its timestamp.
+    '''
+    def __init__(self, first_phase: str = "run") -> None:
+        # (name, timestamp) not applied yet (deque: append / popleft are thread-safe)
+        self._pending = deque()
+        # every marker of the run: { name, time (perf_counter), client_time (time.time() of the client, if known) }
+        self.markers = []
+
+        self.phases = []
+        self._current = self._new_phase(first_phase, None)
+
+        self._last_time = None
+        self._last_power = None
+
+    @staticmethod
+    def _new_phase(name: str, start: Optional[float]) -> dict:
+        return { "name": name, "start": start, "end": start, "samples": 0, "energy": 0.0, "peak_power": None }
+
+    def mark(self, name: str, timestamp: float, client_time: Optional[float] = None):
+        self.markers.append({ "name": name, "time": timestamp, "client_time": client_time })
+        self._pending.append((name, timestamp))
+
+    def _switch_phase(self, name: str, timestamp: float):
+        if self._last_time is None:
+            # no sample yet: the first phase starts with the first sample
+            self._current = self._new_phase(name, None)
+            return
+
+        # a marker can only be applied after the last sample
+        timestamp = max(timestamp, self._last_time)
+        self.phases.append(self._current)
+        self._current = self._new_phase(name, timestamp)
+
+    def add(self, timestamp: float, current: float, voltage: float):
+        power = current * voltage
+
+        while self._pending and self._pending[0][1] <= timestamp:
+            name, marker_time = self._pending.popleft()
+            if self._last_time is not None and marker_time > self._last_time:
+                # power at the marker (linear between the samples around it)
+                marker_power = self._last_power + (power - self._last_power) * (marker_time - self._last_time) / (timestamp - self._last_time)
+                self._current["energy"] += (self._last_power + marker_power) / 2.0 * (marker_time - self._last_time)
+                self._current["end"] = marker_time
+                self._switch_phase(name, marker_time)
+                self._current["peak_power"] = marker_power
+                self._last_time = marker_time
+                self._last_power = marker_power
+            else:
+                self._switch_phase(name, marker_time)
+
+        phase = self._current
+        if phase["start"] is None:
+            phase["start"] = timestamp
+        if self._last_time is not None:
+            phase["energy"] += (self._last_power + power) / 2.0 * (timestamp - self._last_time)
+        phase["peak_power"] = power if phase["peak_power"] is None else max(phase["peak_power"], power)
+        phase["end"] = timestamp
+        phase["samples"] += 1
+
+        self._last_time = timestamp
+        self._last_power = power
+
+    def get_summary(self) -> list[dict]:
+        '''
+        energy of every phase in the order of the markers
+        (markers after the last sample are only listed in markers)
+        '''
+        phases = []
+        for phase in self.phases + [ self._current ]:
+            if phase["start"] is None:
+                continue
+
+            duration = phase["end"] - phase["start"]
+            peak_power = phase["peak_power"] if phase["peak_power"] is not None else 0.0
+            phases.append({
+                **phase,
+                "duration": duration,                                                     # sec
+                "average_power": phase["energy"] / duration if duration > 0 else peak_power, # W
+                "peak_power": peak_power,                                                 # W
+            })
+
+        return phases
@@ -0,0 +1,100 @@
+import bisect
+from typing import Optional
+
+# stages of taking one sample (measuring thread) and of recording it (writer thread)
+QUERY = "query"         # device_controller.get_values()
+RECORD = "record"       # building the record (timestamp + values)
+LOG = "log"             # logging the measured values
+ENQUEUE = "enqueue"     # putting the record into the writer queue
+WRITE = "write"         # writing one batch to the output file
+STAGES = (QUERY, RECORD, LOG, ENQUEUE, WRITE)
+
+# upper bounds (sec) of the buckets of the stage histograms
+# (last bucket collects everything above the last bound)
+STAGE_BUCKETS = (
+    0.00001, 0.00002, 0.00005,
+    0.0001, 0.0002, 0.0005,
+    0.001, 0.002, 0.005,
+    0.01, 0.02, 0.05,
+    0.1, 0.2, 0.5,
+)
+
+PREFIX = "pmpi"
+
+
+class Histogram():
+    def __init__(self, bounds: tuple[float, ...] = STAGE_BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [ 0 ] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics():
+    '''
+    Stage timings and counters of one sampler (or writer).
+
+    Updated by a single thread (the measuring / writing thread),
+    read by the server when the metrics are scraped:
+    a scrape may see a sample counted in a histogram but not yet in a counter.
+    Instrumented code only pays for timing when metrics are set (not None).
+    '''
+    def __init__(self) -> None:
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def add(self, counter: str, value: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def format_metrics(metrics: list[tuple[dict, Metrics]], gauges: Optional[list[tuple[str, dict, float]]] = None) -> str:
+    '''
+    text exposition format (Prometheus) of metrics labelled e.g. { "device": "14" },
+    gauges: (name, labels, value)
+    '''
+    lines = []
+
+    histograms = [ (labels, stage, h) for labels, m in metrics for stage, h in sorted(m.histograms.items()) ]
+    if histograms:
+        name = f"{PREFIX}_stage_seconds"
+        lines += [ f"# HELP {name} time spent in each stage of sampling / recording", f"# TYPE {name} histogram" ]
+        for labels, stage, h in histograms:
+            stage_labels = _labels({ **labels, "stage": stage })
+            cumulative = 0
+            for bound, count in zip(h.bounds + (None,), h.counts):
+                cumulative += count
+                le = "+Inf" if bound is None else f"{bound:g}"
+                lines.append(f'{name}_bucket{{{stage_labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{stage_labels}}} {h.sum:.9f}")
+            lines.append(f"{name}_count{{{stage_labels}}} {h.count}")
+
+    counter_names = sorted({ counter for _, m in metrics for counter in m.counters })
+    for counter in counter_names:
+        name = f"{PREFIX}_{counter}_total"
+        lines.append(f"# TYPE {name} counter")
+        for labels, m in metrics:
+            if counter in m.counters:
+                lines.append(f"{name}{{{_labels(labels)}}} {m.counters[counter]}")
+
+    gauges = gauges or []
+    for gauge in dict.fromkeys(gauge for gauge, _, _ in gauges):
+        name = f"{PREFIX}_{gauge}"
+        lines.append(f"# TYPE {name} gauge")
+        lines += [ f"{name}{{{_labels(labels)}}} {value}" for g, labels, value in gauges if g == gauge ]
+
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,32 @@
 import logging
 import queue
+import threading
 import time
+from enum import Enum, auto
+from typing import Optional
 
 from device_controller.device_controller import DeviceController
-from utils.utils import write_csv
+from sampler.alignment import ChannelAligner, channel_time_titles
+from sampler.energy import EnergyIntegrator, PhaseEnergyIntegrator, write_summary
+from sampler.metrics import ENQUEUE, LOG, QUERY, RECORD, Metrics
+from sampler.scheduler import SKIP, DeadlineScheduler
+from sampler.stream_statistics import StreamStatistics
+from sampler.trigger import SAMPLES_TITLE, TriggerRecorder
+from writer.writer import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, CloseFile, SampleWriter
+
+DEFAULT_MAX_QUEUE_SIZE = 10000
+
+
+class SamplerState(Enum):
+    # waiting for a command to start measurements
+    IDLE = auto()
+    # output file is ready, waiting for the measuring thread to pick it up
+    ARMED = auto()
+    # taking measurements
+    RUNNING = auto()
+    # run ended by an error (e.g. the instrument stopped answering),
+    # its summary (with the error) is returned by the next stop_measurement
+    FAILED = auto()
 
 
 class Sampler():
@@ -12,79 +35,391 @@ class Sampler():
         device_controller: DeviceController,
         output_filename: str,
         sampling_interval: float,
+        schedule_policy: str = SKIP,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        output_format: str = DEFAULT_OUTPUT_FORMAT,
+        device_id: Optional[str] = None,
+        writer: Optional[SampleWriter] = None,
+        channel_timestamps: bool = False,
+        align_channels: bool = False,
+        trigger: Optional[TriggerRecorder] = None,
+        sink_options: Optional[dict] = None,
     ) -> None:
         self.device_controller = device_controller
+        # identifies the device when one server samples several devices
+        self.device_id = device_id
         logging.info(f"Sampling at {sampling_interval}[s]")
         self.sampling_interval = sampling_interval
+        # what to do when deadlines are missed (see sampler/scheduler.py)
+        self.schedule_policy = schedule_policy
 
-        self.queue = queue.Queue()
+        # channel_timestamps: record the start / end of the query of every channel (extra columns)
+        # align_channels: energy / power from the channels interpolated onto the timestamp
+        #                 of the sample (see sampler/alignment.py) instead of the raw readings
+        self.channel_timestamps = channel_timestamps
+        self.align_channels = align_channels
+
+        # set -> trigger mode: only windows around trigger conditions are recorded at full rate,
+        #        summary rows the rest of the time (see sampler/trigger.py);
+        #        energy / power statistics still use every sample
+        self.trigger = trigger
+
+        # measured samples are passed to the writer (running on its own thread) through this queue
+        #
+        # a writer shared with other samplers (e.g. MergingWriter) is
+        # opened, closed and stopped by its owner, not by the sampler
+        self._owns_writer = writer is None
+        if writer is None:
+            self.queue = queue.Queue(maxsize=max_queue_size)
+            # sink_options: see SampleWriter (only used for a writer owned by the sampler)
+            self.writer = SampleWriter(self.queue, sink_options=sink_options)
+        else:
+            self.queue = writer.queue
+            self.writer = writer
         self.output_filename = output_filename
-        self.output_file = None
+        self._output_file_opened = False
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {tuple(OUTPUT_FORMATS)}, got {output_format}")
+        self.output_format = output_format
+
+        # IDLE -> ARMED (start_measurement) -> RUNNING (measuring thread) -> IDLE (stop_measurement)
+        # all state changes are notified through this condition variable
+        self._state_changed = threading.Condition()
+        self._state = SamplerState.IDLE
+        self._shutdown = False
+
+        # set() -> wakes up the measuring thread from its sleep between samples
+        self._stop_sampling = threading.Event()
+
+        # first deadline of the current run (None -> when the run starts),
+        # shared by samplers started together so that their ticks line up
+        self._t0 = None
+        # perf_counter of the first sample of the current run
+        self._first_sample_time = None
+
+        # output file requested for the current run and
+        # energy / power summary of the last run (see sampler/energy.py)
+        self._run_filename = None
+        self._summary = None
+        # clock offset of the client that started the run (see client/clock_sync.py),
+        # stored in the summary to map client timestamps onto the samples
+        self._run_clock = None
+        # statistics of the power of every sample of the current (or last) run
+        self._power_statistics = StreamStatistics()
+        # energy of the phases of the current run, delimited by markers
+        self._phases = PhaseEnergyIntegrator()
+
+        # stage timings / counters of the measuring thread (None -> not instrumented, see enable_metrics)
+        self.metrics = None
     
     def set_output_filename(self, filename: str):
-        if self.output_file:
-            self.output_file.close()
-
+        # writer closes the previous file (if any) before opening the new one
         self.output_filename = f"measurement_data/{filename}"
-        self.output_file = open(filename, 'w')
+        if self._owns_writer:
+            self.writer.open(filename, self.get_titles(), self.output_format)
+            self._output_file_opened = True
 
-    def _close_output_file(self):
-        if self.output_file:
-            self.output_file.close()
-            self.output_file = None
+    def _close_output_file(self) -> Optional[CloseFile]:
+        '''
+        returns the control message to wait for the writer (None: no file opened by the sampler)
+        '''
+        if self._owns_writer and self._output_file_opened:
+            self._output_file_opened = False
+            return self.writer.close()
+        return None
 
     def close(self):
         self.device_controller.close()
 
+    def enable_metrics(self) -> Metrics:
+        '''
+        must be called before the measuring thread starts,
+        also instruments the writer if it is owned by the sampler
+        '''
+        self.metrics = Metrics()
+        if self._owns_writer:
+            self.writer.metrics = Metrics()
+        return self.metrics
+
+    def get_titles(self) -> tuple[str, ...]:
+        '''
+        titles of the columns of the records
+        '''
+        titles = tuple(self.device_controller.get_titles())
+        if self.channel_timestamps:
+            titles += channel_time_titles(titles)
+        if self.trigger is not None:
+            titles += (SAMPLES_TITLE,)
+        return titles
+
+    def get_state(self) -> SamplerState:
+        with self._state_changed:
+            return self._state
+
+    def start_measurement(self, filename: str, t0: Optional[float] = None, clock: Optional[dict] = None) -> Optional[float]:
+        '''
+        IDLE -> ARMED, the measuring thread is woken up and starts sampling
+
+        returns the timestamp of the first sample once it has been taken
+        (None if the run was stopped before that),
+        raises RuntimeError if a measurement is already running or the output file cannot be created
+        '''
+        self.arm(filename, t0, clock)
+        return self.wait_for_first_sample()
+
+    def arm(self, filename: str, t0: Optional[float] = None, clock: Optional[dict] = None):
+        '''
+        IDLE (or FAILED) -> ARMED without waiting for the first sample,
+        t0: perf_counter of the first deadline (default: as soon as the measuring thread wakes up)
+        clock: clock offset estimate of the client, stored in the summary of the run
+        '''
+        with self._state_changed:
+            if self._shutdown:
+                return
+            if self._state not in (SamplerState.IDLE, SamplerState.FAILED):
+                raise RuntimeError("a measurement is already running")
+            # a bad filename fails here, not later on the writer thread
+            if self._owns_writer:
+                self.writer.check_output_file(filename, self.output_format)
+            if self._state is SamplerState.FAILED:
+                logging.info(f"Summary of the failed run {self._run_filename} not collected: {self._summary}")
+
+            self.set_output_filename(filename)
+            self._run_filename = filename
+            self._summary = None
+            self._run_clock = clock
+            self._power_statistics = StreamStatistics()
+            self._phases = PhaseEnergyIntegrator()
+            self._t0 = t0
+            self._first_sample_time = None
+            self._stop_sampling.clear()
+            self._state = SamplerState.ARMED
+            self._state_changed.notify_all()
+
+    def wait_for_first_sample(self) -> Optional[float]:
+        with self._state_changed:
+            self._state_changed.wait_for(
+                lambda: self._first_sample_time is not None or self._stop_sampling.is_set()
+            )
+            return self._first_sample_time
+
+    def stop_measurement(self) -> Optional[dict]:
+        '''
+        ARMED/RUNNING/FAILED -> IDLE, returns once the measuring thread stopped sampling
+
+        returns the energy / power summary of the run (None if no run was started),
+        with "error" if the run was ended by an error,
+        "writer_error" if its samples could not all be written and
+        "summary_error" if its summary file could not be written
+        '''
+        with self._state_changed:
+            if self._state is SamplerState.IDLE:
+                return None
+
+            if self._state is SamplerState.ARMED:
+                self._close_output_file()
+                self._state = SamplerState.IDLE
+                # wakes up wait_for_first_sample
+                self._stop_sampling.set()
+                self._state_changed.notify_all()
+                return None
+
+            if self._state is SamplerState.RUNNING:
+                self._stop_sampling.set()
+                self._state_changed.wait_for(lambda: self._shutdown or self._state is not SamplerState.RUNNING)
+
+            if self._state is SamplerState.FAILED:
+                self._state = SamplerState.IDLE
+                self._state_changed.notify_all()
+            return self._summary
+
+    def add_marker(self, name: str, timestamp: float, client_time: Optional[float] = None) -> bool:
+        '''
+        starts phase `name` of the current run at timestamp (perf_counter),
+        can be called from any thread
+
+        returns False if no run is armed or running
+        '''
+        with self._state_changed:
+            if self._state is SamplerState.IDLE:
+                return False
+            phases = self._phases
+
+        phases.mark(name, timestamp, client_time)
+        return True
+
+    def get_power_statistics(self) -> dict:
+        '''
+        statistics (moments, quantiles) of the power of the current run so far (or of the last run)
+        '''
+        return self._power_statistics.get_summary()
+
+    def shutdown(self):
+        '''
+        stops the measuring thread (cannot resume)
+        '''
+        with self._state_changed:
+            self._shutdown = True
+            self._stop_sampling.set()
+            self._state_changed.notify_all()
+
     def _get_one_sample(self) -> list[float]:
         return list(self.device_controller.get_values())
 
-    def measure(self, stop_event, pause_event):
-        while not stop_event.is_set():
-            logging.debug("First measure while loop")
-            # | end | loop? |
-            # | --- | ---   |
-            # | 0   | 1     |
-            # | 1   | 0     |
-            #
-            # loop as long as it's not the end,
-            # can be
-            # - taking measurements
-            # - waiting for command to start measurements
-
-            if self.output_file == None:
-                self.output_file = open(self.output_filename, 'w')
-
-            last_measured_time = None
-            num_sample_cycles = 0
-
-            while not stop_event.is_set() and not pause_event.is_set():
-                logging.debug("Second measure while loop")
-                logging.debug(f"Last measured time: {last_measured_time}")
-                # | stop    | measure?  |
-                # | ---     | ---       |
-                # | 0       | 1         |
-                # | 1       | 0         |
-                #
-                # measure when it's not the end && not stop measurements
+    def measure(self):
+        try:
+            self._measure_runs()
+        finally:
+            # even if the thread dies: nobody waits for it forever, the writer ends
+            with self._state_changed:
+                self._shutdown = True
+                self._stop_sampling.set()
+                self._state_changed.notify_all()
+
+            self._close_output_file()
+            if self._owns_writer:
+                self.writer.stop()
+            logging.info("end measuring")
+
+    def _measure_runs(self):
+        while True:
+            with self._state_changed:
+                # IDLE: block (no polling) until a run is armed or shutdown is requested
+                self._state_changed.wait_for(lambda: self._shutdown or self._state is SamplerState.ARMED)
+                if self._shutdown:
+                    break
+
+                self._state = SamplerState.RUNNING
+                self._state_changed.notify_all()
+
+            summary = self._take_samples()
+            if self._run_clock is not None:
+                summary["clock"] = self._run_clock
+
+            # once the file is closed, every sample of the run has been written (or dropped)
+            with self._state_changed:
+                closing = self._close_output_file()
+            if closing is not None:
+                writer_error = closing.wait()
+                if writer_error is not None:
+                    summary["writer_error"] = writer_error
+
+            # sidecar next to the sample file
+            # (the owner of a shared writer writes the sidecar of the shared file)
+            if self._owns_writer:
+                try:
+                    write_summary(self._run_filename, summary)
+                except Exception as err:
+                    # the run itself is fine, the sampler stays usable
+                    logging.error(f"Writing the summary of {self._run_filename} failed: {err!r}")
+                    summary["summary_error"] = repr(err)
+
+            with self._state_changed:
+                self._summary = summary
+                self._state = SamplerState.FAILED if "error" in summary else SamplerState.IDLE
+                self._state_changed.notify_all()
+
+    def _take_samples(self) -> dict:
+        '''
+        returns the energy / power summary of the run
+        '''
+        scheduler = DeadlineScheduler(self.sampling_interval, policy=self.schedule_policy)
+        scheduler.start(self._t0)
+        energy = EnergyIntegrator()
+        phases = self._phases
+        power_statistics = self._power_statistics
+        metrics = self.metrics
+        # scheduler counts already added to the metrics
+        num_missed = num_skipped = 0
+        timed = self.channel_timestamps or self.align_channels
+        aligner = ChannelAligner() if self.align_channels else None
+        trigger = self.trigger
+        if trigger is not None:
+            trigger.reset(self.sampling_interval)
+
+        error = None
+        try:
+            while not self._stop_sampling.is_set():
+                # sleep until the next deadline (t0 + n * sampling_interval),
+                # wake up early if measurements are stopped
+                if scheduler.wait_next(interrupt_event=self._stop_sampling) is None:
+                    break
+
                 current_time = time.perf_counter()
-                duration_from_last_measured = (current_time - last_measured_time)\
-                                                if (last_measured_time is not None)\
-                                                else self.sampling_interval
+                if timed:
+                    sample, channel_times = self.device_controller.get_timed_values()
+                else:
+                    sample = self._get_one_sample()
+                if metrics is not None:
+                    query_end = time.perf_counter()
+                    metrics.observe(QUERY, query_end - current_time)
+
+                values = ( current_time, *sample )
+                if self.channel_timestamps:
+                    values += tuple(t for query_times in channel_times for t in query_times)
+
+                # [ current, voltage ]
+                if aligner is not None:
+                    current, voltage = aligner.align(current_time, sample, channel_times)
+                else:
+                    current, voltage = sample
+                if metrics is not None:
+                    record_end = time.perf_counter()
+                    metrics.observe(RECORD, record_end - query_end)
+
+                logging.info(f"Measured value: {values}")
+                if metrics is not None:
+                    log_end = time.perf_counter()
+                    metrics.observe(LOG, log_end - record_end)
+
+                # tick of the sample that has just been taken
+                if trigger is not None:
+                    for record, tick in trigger.add(values, scheduler.next_tick - 1, current, voltage):
+                        self.writer.put_sample(record, tick, self.device_id)
+                else:
+                    self.writer.put_sample(values, scheduler.next_tick - 1, self.device_id)
+                if metrics is not None:
+                    metrics.observe(ENQUEUE, time.perf_counter() - log_end)
+                    metrics.add("samples")
+                    metrics.add("deadlines_missed", scheduler.num_missed - num_missed)
+                    metrics.add("ticks_skipped", scheduler.num_skipped - num_skipped)
+                    num_missed, num_skipped = scheduler.num_missed, scheduler.num_skipped
+
+                energy.add(current_time, current, voltage)
+                phases.add(current_time, current, voltage)
+                power_statistics.add(current * voltage)
 
-                remaining_time = self.sampling_interval - duration_from_last_measured
-                logging.debug(f"remaining time: {remaining_time}")
+                if self._first_sample_time is None:
+                    with self._state_changed:
+                        self._first_sample_time = current_time
+                        self._state_changed.notify_all()
+        except Exception as err:
+            # e.g. the instrument stopped answering: the run ends with what was sampled
+            logging.error(f"Sampling failed: {err!r}")
+            error = repr(err)
+            with self._state_changed:
+                # wakes up wait_for_first_sample
+                self._stop_sampling.set()
+                self._state_changed.notify_all()
 
-                # need to take sample
-                if remaining_time <= 0:
-                    last_measured_time = current_time
-                    values = [ current_time ] + self._get_one_sample()
-                    logging.info(f"Measured value: {values}")
+        if scheduler.num_ticks > 0:
+            logging.info(f"Scheduler stats: {scheduler.get_stats()}")
 
-                    write_csv(csv=self.output_file, items=values)
+        if trigger is not None:
+            for record, tick in trigger.flush():
+                self.writer.put_sample(record, tick, self.device_id)
 
-                    num_sample_cycles += 1
-                elif remaining_time > 0.01:
-                    time.sleep(remaining_time / 2.0)
+        summary = energy.get_summary()
+        summary["power"] = power_statistics.get_summary()
+        if trigger is not None:
+            summary["trigger"] = trigger.get_stats()
+        if error is not None:
+            summary["error"] = error
+        if phases.markers:
+            summary["markers"] = phases.markers
+            summary["phases"] = phases.get_summary()
+        logging.info(f"Run summary: {summary}")
 
-        logging.info("end measuring")
+        # to merge the statistics of several runs (see StreamStatistics.from_dict)
+        summary["power_statistics"] = power_statistics.to_dict()
+        return summary
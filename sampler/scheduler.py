@@ -0,0 +1,106 @@
+import bisect
+import threading
+import time
+from typing import Optional
+
+# what to do with deadlines that have already passed
+# - catch up: take the missed samples back to back until on schedule again
+# - skip:     drop the missed ticks and wait for the next future deadline
+CATCH_UP = "catch_up"
+SKIP = "skip"
+POLICIES = (CATCH_UP, SKIP)
+
+# upper bounds (sec) of the buckets of the jitter histogram
+# (last bucket collects everything above the last bound)
+JITTER_BUCKETS = (
+    0.0001, 0.0002, 0.0005,
+    0.001, 0.002, 0.005,
+    0.01, 0.02, 0.05,
+    0.1, 0.2, 0.5,
+)
+
+
+class DeadlineScheduler():
+    '''
+    Schedules ticks at absolute deadlines t0 + n * interval,
+    so that the time spent between two ticks (e.g. querying the device)
+    does not make the sampling intervals drift.
+    '''
+    def __init__(self, interval: float, policy: str = SKIP) -> None:
+        if interval <= 0:
+            raise ValueError(f"interval must be positive, got {interval}")
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, got {policy}")
+
+        self.interval = interval
+        self.policy = policy
+
+        self.t0 = None
+        self.next_tick = 0
+
+        self.num_ticks = 0
+        self.num_missed = 0
+        self.num_skipped = 0
+        self.max_jitter = 0.0
+        self.jitter_histogram = [ 0 ] * (len(JITTER_BUCKETS) + 1)
+
+    def start(self, t0: Optional[float] = None):
+        '''
+        first deadline is t0 (default: now)
+        '''
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.next_tick = 0
+
+    def wait_next(self, interrupt_event: Optional[threading.Event] = None) -> Optional[float]:
+        '''
+        sleep until the next deadline and return it.
+
+        returns None (without consuming the tick) when interrupt_event is set while waiting.
+        '''
+        if self.t0 is None:
+            self.start()
+
+        deadline = self.t0 + self.next_tick * self.interval
+        timeout = deadline - time.perf_counter()
+
+        if timeout > 0:
+            if interrupt_event is not None:
+                if interrupt_event.wait(timeout):
+                    return None
+            else:
+                time.sleep(timeout)
+
+        lateness = time.perf_counter() - deadline
+
+        # the next deadline has already passed as well
+        if lateness >= self.interval:
+            self.num_missed += 1
+
+            if self.policy == SKIP:
+                num_ticks_behind = int(lateness // self.interval)
+                self.num_skipped += num_ticks_behind
+                self.next_tick += num_ticks_behind
+                deadline += num_ticks_behind * self.interval
+                lateness -= num_ticks_behind * self.interval
+
+        self._record_jitter(lateness)
+        self.next_tick += 1
+        self.num_ticks += 1
+
+        return deadline
+
+    def _record_jitter(self, lateness: float):
+        self.max_jitter = max(self.max_jitter, lateness)
+        self.jitter_histogram[bisect.bisect_left(JITTER_BUCKETS, lateness)] += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "ticks": self.num_ticks,
+            "missed": self.num_missed,
+            "skipped": self.num_skipped,
+            "max_jitter": self.max_jitter,
+            "jitter_histogram": {
+                f"<={bound * 1000:g}ms" if i < len(JITTER_BUCKETS) else f">{JITTER_BUCKETS[-1] * 1000:g}ms": count
+                for i, (bound, count) in enumerate(zip(JITTER_BUCKETS + (None,), self.jitter_histogram))
+            },
+        }
@@ -0,0 +1,192 @@
+import math
+import threading
+from typing import Optional
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BINS = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RunningMoments():
+    '''
+    Count, mean, variance, min and max in constant memory (Welford),
+    mergeable with the moments of another stream (Chan et al.).
+    '''
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "RunningMoments"):
+        if other.count == 0:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self) -> float:
+        '''
+        sample variance
+        '''
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self) -> dict:
+        return { "count": self.count, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "RunningMoments":
+        moments = cls()
+        moments.count = d["count"]
+        moments.mean = d["mean"]
+        moments.m2 = d["m2"]
+        moments.min = d["min"]
+        moments.max = d["max"]
+        return moments
+
+
+class QuantileSketch():
+    '''
+    Mergeable quantile sketch with relative accuracy (DDSketch):
+    values fall into logarithmic bins, a quantile is estimated within
+    relative_accuracy of the true value.
+
+    Values <= 0 are counted in a separate zero bin.
+    Memory is bounded by max_bins (lowest bins are collapsed first).
+    '''
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = DEFAULT_MAX_BINS) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+        # bin index -> count
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+
+        i = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[i] = self.bins.get(i, 0) + 1
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cannot merge sketches with different relative accuracy")
+
+        for i, count in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+        while len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        lowest, second = sorted(self.bins)[:2]
+        self.bins[second] += self.bins.pop(lowest)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if rank < seen:
+                return 2 * self._gamma ** i / (self._gamma + 1)
+
+        return 2 * self._gamma ** max(self.bins) / (self._gamma + 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "bins": [ [ i, count ] for i, count in self.bins.items() ],
+            "zero_count": self.zero_count,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "QuantileSketch":
+        sketch = cls(relative_accuracy=d["relative_accuracy"], max_bins=d["max_bins"])
+        sketch.bins = { i: count for i, count in d["bins"] }
+        sketch.zero_count = d["zero_count"]
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+
+class StreamStatistics():
+    '''
+    Constant-memory statistics of a stream of values (e.g. power of every sample):
+    moments and quantiles, queryable from another thread at any time
+    and mergeable across runs (e.g. repetitions of the same experiment).
+    '''
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> None:
+        self.moments = RunningMoments()
+        self.sketch = QuantileSketch(relative_accuracy=relative_accuracy)
+        self._lock = threading.Lock()
+
+    def add(self, value: float):
+        with self._lock:
+            self.moments.add(value)
+            self.sketch.add(value)
+
+    def merge(self, other: "StreamStatistics"):
+        with self._lock:
+            self.moments.merge(other.moments)
+            self.sketch.merge(other.sketch)
+
+    def get_summary(self) -> dict:
+        with self._lock:
+            if self.moments.count == 0:
+                return { "count": 0 }
+
+            summary = {
+                "count": self.moments.count,
+                "mean": self.moments.mean,
+                "variance": self.moments.variance(),
+                "min": self.moments.min,
+                "max": self.moments.max,
+            }
+            for q in QUANTILES:
+                # estimate can not be outside of [min, max]
+                estimate = min(max(self.sketch.quantile(q), self.moments.min), self.moments.max)
+                summary[f"p{q * 100:g}"] = estimate
+
+            return summary
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return { "moments": self.moments.to_dict(), "sketch": self.sketch.to_dict() }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "StreamStatistics":
+        statistics = cls(relative_accuracy=d["sketch"]["relative_accuracy"])
+        statistics.moments = RunningMoments.from_dict(d["moments"])
+        statistics.sketch = QuantileSketch.from_dict(d["sketch"])
+        return statistics
@@ -0,0 +1,238 @@
+import math
+from array import array
+from typing import Optional
+
+# extra column of the records in trigger mode:
+# 1 for samples of a trigger window, number of samples averaged for summary rows
+SAMPLES_TITLE = "samples"
+
+DEFAULT_PRE_TRIGGER = 0.5 # sec
+DEFAULT_POST_TRIGGER = 1.0 # sec
+DEFAULT_SUMMARY_INTERVAL = 1.0 # sec
+# bound of the ring buffer (samples), whatever the pre-trigger length and sampling rate
+DEFAULT_MAX_SAMPLES = 100_000
+
+_NO_RECORDS = ()
+
+
+class _RingBuffer():
+    '''
+    the last samples (records + ticks) in flat arrays of fixed size
+    '''
+    def __init__(self, capacity: int, num_columns: int) -> None:
+        self.capacity = capacity
+        self.num_columns = num_columns
+        self.values = array('d', bytes(8 * capacity * num_columns))
+        self.ticks = array('q', bytes(8 * capacity))
+        # slot of the oldest sample, number of samples
+        self.head = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def push(self, record: tuple[float, ...], tick: int):
+        '''
+        the buffer must not be full
+        '''
+        slot = (self.head + self.count) % self.capacity
+        self.values[slot * self.num_columns:(slot + 1) * self.num_columns] = array('d', record)
+        self.ticks[slot] = tick
+        self.count += 1
+
+    def oldest_time(self) -> float:
+        return self.values[self.head * self.num_columns]
+
+    def pop(self) -> tuple[tuple[float, ...], int]:
+        '''
+        removes the oldest sample
+        '''
+        start = self.head * self.num_columns
+        record = tuple(self.values[start:start + self.num_columns])
+        tick = self.ticks[self.head]
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+        return record, tick
+
+
+class _SummaryRow():
+    '''
+    mean of every column of the samples not recorded at full rate
+    '''
+    def __init__(self, num_columns: int) -> None:
+        self.sums = [ 0.0 ] * num_columns
+        self.count = 0
+        self.first_time = None
+        self.last_tick = None
+
+    def add(self, record: tuple[float, ...], tick: int):
+        if self.count == 0:
+            self.first_time = record[0]
+        for i, value in enumerate(record):
+            self.sums[i] += value
+        self.count += 1
+        self.last_tick = tick
+
+    def to_record(self) -> tuple[float, ...]:
+        return ( *(s / self.count for s in self.sums), float(self.count) )
+
+
+class TriggerRecorder():
+    '''
+    Trigger mode of the sampler: decides which samples are recorded.
+
+    The last pre_trigger seconds of samples are kept in a ring buffer. When the power
+    reaches power_threshold or |dI/dt| reaches di_dt_threshold, the buffer and every sample
+    until post_trigger seconds after the condition last held are recorded (full rate).
+    Samples leaving the buffer without a trigger are averaged into one summary row
+    per summary_interval seconds (low rate, delayed by pre_trigger seconds).
+
+    Every record gets an extra column (SAMPLES_TITLE): 1 for samples of a trigger window,
+    number of samples averaged for summary rows.
+
+    Samples are still taken every sampling_interval (deadline scheduler), not at the maximum
+    rate of the device: "full rate" is the sampling rate, so pick a short sampling_interval.
+
+    Used by the measuring thread only, reset() before every run.
+    '''
+    def __init__(
+        self,
+        power_threshold: Optional[float] = None,
+        di_dt_threshold: Optional[float] = None,
+        pre_trigger: float = DEFAULT_PRE_TRIGGER,
+        post_trigger: float = DEFAULT_POST_TRIGGER,
+        summary_interval: float = DEFAULT_SUMMARY_INTERVAL,
+        max_samples: int = DEFAULT_MAX_SAMPLES,
+    ) -> None:
+        if power_threshold is None and di_dt_threshold is None:
+            raise ValueError("a power threshold or a dI/dt threshold is required")
+        if pre_trigger < 0 or post_trigger < 0:
+            raise ValueError(f"pre / post trigger lengths must not be negative, got {pre_trigger} / {post_trigger}")
+        if summary_interval <= 0:
+            raise ValueError(f"summary interval must be positive, got {summary_interval}")
+
+        self.power_threshold = power_threshold
+        self.di_dt_threshold = di_dt_threshold
+        self.pre_trigger = pre_trigger
+        self.post_trigger = post_trigger
+        self.summary_interval = summary_interval
+        self.max_samples = max_samples
+
+        self.reset()
+
+    def reset(self, sampling_interval: Optional[float] = None):
+        '''
+        sampling_interval: sizes the ring buffer for pre_trigger seconds of samples
+        (twice as many, for samples catching up with missed deadlines), at most max_samples
+        '''
+        self._capacity = self.max_samples
+        if sampling_interval is not None and sampling_interval > 0:
+            self._capacity = min(self.max_samples, 2 * math.ceil(self.pre_trigger / sampling_interval) + 1)
+
+        # allocated with the first sample of the run (number of columns)
+        self._ring = None
+        self._summary = None
+        # samples are recorded at full rate until this time (None: no trigger window open)
+        self._window_end = None
+        self._last_current = None
+        self._last_time = None
+
+        self.num_triggers = 0
+        self.num_samples = 0
+        self.num_window_samples = 0
+        self.num_summary_rows = 0
+
+    def _is_triggered(self, timestamp: float, current: float, voltage: float) -> bool:
+        triggered = self.power_threshold is not None and current * voltage >= self.power_threshold
+
+        if self.di_dt_threshold is not None and self._last_time is not None and timestamp > self._last_time:
+            di_dt = (current - self._last_current) / (timestamp - self._last_time)
+            triggered = triggered or abs(di_dt) >= self.di_dt_threshold
+
+        self._last_current = current
+        self._last_time = timestamp
+        return triggered
+
+    def _summarize(self, record: tuple[float, ...], tick: int, records: list):
+        '''
+        adds a sample leaving the ring buffer to the summary row,
+        which is appended to records once it spans summary_interval
+        '''
+        summary = self._summary
+        if summary.count > 0 and record[0] - summary.first_time >= self.summary_interval:
+            self._flush_summary(records)
+        self._summary.add(record, tick)
+
+    def _flush_summary(self, records: list):
+        summary = self._summary
+        if summary.count > 0:
+            records.append((summary.to_record(), summary.last_tick))
+            self.num_summary_rows += 1
+            self._summary = _SummaryRow(len(summary.sums))
+
+    def add(self, record: tuple[float, ...], tick: int, current: float, voltage: float) -> list[tuple[tuple[float, ...], int]]:
+        '''
+        current / voltage: readings of the sample (e.g. aligned, see sampler/alignment.py),
+        returns the (record, tick) to write, oldest first (usually none)
+        '''
+        if self._ring is None:
+            self._ring = _RingBuffer(self._capacity, len(record))
+            self._summary = _SummaryRow(len(record))
+        self.num_samples += 1
+
+        timestamp = record[0]
+        ring = self._ring
+        records = None
+
+        if self._is_triggered(timestamp, current, voltage):
+            if self._window_end is None:
+                self.num_triggers += 1
+                # pre-trigger samples, after the summary of the samples before them
+                records = []
+                self._flush_summary(records)
+                while len(ring) > 0:
+                    pre_record, pre_tick = ring.pop()
+                    records.append(((*pre_record, 1.0), pre_tick))
+                    self.num_window_samples += 1
+            self._window_end = timestamp + self.post_trigger
+
+        if self._window_end is not None:
+            if timestamp <= self._window_end:
+                if records is None:
+                    records = []
+                records.append(((*record, 1.0), tick))
+                self.num_window_samples += 1
+                return records
+            self._window_end = None
+
+        # not recorded (yet): the oldest samples leave the ring buffer into the summary
+        while len(ring) > 0 and (len(ring) >= ring.capacity or timestamp - ring.oldest_time() > self.pre_trigger):
+            if records is None:
+                records = []
+            old_record, old_tick = ring.pop()
+            self._summarize(old_record, old_tick, records)
+        ring.push(record, tick)
+
+        return records if records is not None else _NO_RECORDS
+
+    def flush(self) -> list[tuple[tuple[float, ...], int]]:
+        '''
+        end of run: summary of the samples still buffered
+        '''
+        records = []
+        if self._ring is None:
+            return records
+
+        while len(self._ring) > 0:
+            old_record, old_tick = self._ring.pop()
+            self._summarize(old_record, old_tick, records)
+        self._flush_summary(records)
+        return records
+
+    def get_stats(self) -> dict:
+        return {
+            "triggers": self.num_triggers,
+            "samples": self.num_samples,
+            "window_samples": self.num_window_samples,
+            "summary_rows": self.num_summary_rows,
+        }
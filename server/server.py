@@ -1,83 +1,430 @@
+import asyncio
 import logging
-import socket
+import os
+import signal
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from sampler.sampler import Sampler
+from protocol.protocol import MARK, PING, START, STATS, STOP, SUBSCRIBE, recv_message_async, send_message_async, validate_request
+from sampler.energy import write_summary
+from sampler.metrics import Metrics, format_metrics
+from sampler.sampler import Sampler, SamplerState
+from server.subscriber import DROP_OLDEST, SubscriberHub
+from writer.merging_writer import MergingWriter, merged_titles
+from writer.pyramid import PyramidBuilder
+
+# the metrics endpoint only answers on this host
+METRICS_HOST = "127.0.0.1"
+
+# samplers started together share a first deadline this far in the future,
+# so that all of them are awake and take their samples at the same ticks
+START_LEAD_TIME = 0.005 # sec
 
 class Server:
     def __init__(self,
-        sampler: Sampler,
+        samplers: dict[str, Sampler],
         host: str,
         port: int,
+        subscriber_policy: str = DROP_OLDEST,
+        merged_writer: Optional[MergingWriter] = None,
+        pyramid_widths: Optional[tuple[float, ...]] = None,
+        metrics_port: Optional[int] = None,
     ) -> None:
         # set() -> stop everything (cannot resume)
         self.stop_event = threading.Event()
-        
-        # set() -> pause measurements (can resume)
-        self.pause_event = threading.Event()
-        self.pause_event.set()
 
-        # sampler that performs measurements
-        self.sampler = sampler
+        # device id -> sampler that performs measurements on that device
+        # (one measuring thread per device, all stamped with time.perf_counter of this process)
+        self.samplers = samplers
+
+        # set -> samplers write to this writer, which merges their samples into one file
+        self.merged_writer = merged_writer
+        self._merged_filename = None
+
+        # writers of all samplers (run on their own threads)
+        self.writers = []
+        for sampler in self.samplers.values():
+            if all(sampler.writer is not w for w in self.writers):
+                self.writers.append(sampler.writer)
+
+        # clients subscribed to live samples (fed by the writers, frames tagged with
+        # the device id, or the device ids joined with "+" for a shared writer)
+        self.subscribers = SubscriberHub(policy=subscriber_policy)
+        for writer in self.writers:
+            device_ids = [ device_id for device_id, sampler in self.samplers.items() if sampler.writer is writer ]
+            writer.add_listener(self.subscribers.listener("+".join(device_ids)))
+
+        # set -> every sample file gets a min / max / mean index for plotting (see writer/pyramid.py)
+        if pyramid_widths is not None:
+            for writer in self.writers:
+                writer.add_listener(PyramidBuilder(pyramid_widths))
+
+        # set -> stage timings / counters of samplers and writers are served
+        # as text (Prometheus format) on http://127.0.0.1:<metrics_port>/metrics
+        self.metrics_port = metrics_port
+        if metrics_port is not None:
+            for sampler in self.samplers.values():
+                sampler.enable_metrics()
+            for writer in self.writers:
+                if writer.metrics is None:
+                    writer.metrics = Metrics()
 
         self.host = host
         self.port = port
 
-    def run_server(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((self.host, self.port))
-            s.listen()
-            logging.info(f"Listening on port {self.port}...")
+        # set by run() / run_server()
+        self._executor = None
+        self._loop = None
+        self._stopping = None
+
+    async def run_server(self):
+        '''
+        serves any number of concurrent connections on the event loop
+        '''
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        if self.stop_event.is_set():
+            return
+
+        # ^C / SIGTERM -> cooperative shutdown
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                self._loop.add_signal_handler(sig, self._stopping.set)
+
+        # task handling the connection -> its stream writer
+        connections = {}
+
+        async def handle_connection(reader, writer):
+            task = asyncio.current_task()
+            connections[task] = writer
+            try:
+                await self._handle_connection(reader, writer)
+            finally:
+                del connections[task]
+
+        server = await asyncio.start_server(handle_connection, self.host, self.port, reuse_address=True)
+        logging.info(f"Listening on port {self.port}...")
+
+        metrics_server = None
+        if self.metrics_port is not None:
+            metrics_server = await asyncio.start_server(self._handle_metrics_connection, METRICS_HOST, self.metrics_port, reuse_address=True)
+            logging.info(f"Serving metrics on http://{METRICS_HOST}:{self.metrics_port}/metrics")
 
-            while not self.stop_event.is_set():
-                conn = None
+        async with server:
+            await self._stopping.wait()
+
+            logging.info("Stopping server...")
+            self.stop_event.set()
+            server.close()
+            if metrics_server is not None:
+                metrics_server.close()
+
+            # unblock requests waiting for the samplers, then close all connections
+            # (handlers see the connection closed and return)
+            self._shutdown_samplers()
+            self.subscribers.close()
+            for writer in connections.values():
+                writer.close()
+            await asyncio.gather(*connections, return_exceptions=True)
+
+    def stop(self):
+        '''
+        stops the server (can be called from any thread)
+        '''
+        self.stop_event.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        addr = writer.get_extra_info('peername')
+        logging.info(f"Connected by: {addr}")
+
+        try:
+            while True:
                 try:
-                    logging.info("(accept) Waiting for connection...")
-                    conn, addr = s.accept()
-                    with conn:
-                        logging.info(f"Connected by: {addr}")
-
-                        while not self.stop_event.is_set():
-                            msg_from_client = conn.recv(1024)
-                            logging.debug(f"From client: {msg_from_client}")
-
-                            if not msg_from_client: break
-                            else:
-                                if msg_from_client.startswith(b'M_start'):
-                                    output_filename = msg_from_client.decode('utf-8').replace('M_start_', '')
-                                    self.sampler.set_output_filename(output_filename)
-                                    self.pause_event.clear()
-                                    logging.info("Start new measurement")
-                                elif msg_from_client.startswith(b'M_stop'):
-                                    self.pause_event.set()
-                                    logging.info("Stop measurement")
-
-                except KeyboardInterrupt:
-                    if conn: conn.close()
+                    request = await recv_message_async(reader)
+                except ValueError as err:
+                    # not JSON: the frame was read whole, the connection stays usable
+                    await send_message_async(writer, { "ok": False, "error": f"malformed request: {err}" })
+                    continue
+                received_time = time.perf_counter()
+                logging.debug(f"From client: {request}")
+
+                if request is None: break
+
+                error = validate_request(request)
+                if error is not None:
+                    logging.info(f"Bad request from {addr}: {error}")
+                    if isinstance(request, dict) and request.get("command") == MARK:
+                        # no reply
+                        continue
+                    reply = { "ok": False, "error": error }
+                    if isinstance(request, dict) and "id" in request:
+                        reply["id"] = request["id"]
+                    await send_message_async(writer, reply)
+                    continue
+
+                if request.get("command") == PING:
+                    # answered right on the event loop, so that both timestamps
+                    # are as close as possible to the wire (see client/clock_sync.py)
+                    reply = { "ok": True, "receive_time": received_time, "send_time": time.perf_counter() }
+                    if "id" in request:
+                        reply["id"] = request["id"]
+                    await send_message_async(writer, reply)
+                    continue
+
+                if request.get("command") == MARK:
+                    # stamped on receipt, no reply (the client does not wait)
+                    self._add_marker(request, received_time)
+                    continue
+
+                if request.get("command") == SUBSCRIBE:
+                    await send_message_async(writer, { "ok": True })
+                    # this connection only receives samples from now on
+                    await self.subscribers.subscribe(writer, addr)
                     break
 
-            logging.info("Stopping server...")
+                # sampler calls block (e.g. until the first sample is taken),
+                # they are executed off the event loop
+                try:
+                    reply = await self._loop.run_in_executor(self._executor, self._handle_request, request, received_time)
+                except Exception as err:
+                    # a bug must not drop the connection without a reply
+                    logging.error(f"Request {request} failed: {err!r}")
+                    reply = { "ok": False, "error": f"server error: {err!r}" }
+                if "id" in request:
+                    reply["id"] = request["id"]
+                await send_message_async(writer, reply)
+        except (ConnectionError, OSError) as err:
+            logging.info(f"Connection with {addr} lost: {err}")
+        finally:
+            writer.close()
+            logging.info(f"Disconnected: {addr}")
+
+    def get_metrics(self) -> str:
+        metrics = [ ({ "device": device_id }, sampler.metrics) for device_id, sampler in self.samplers.items() if sampler.metrics is not None ]
+        metrics += [ ({ "writer": str(i) }, writer.metrics) for i, writer in enumerate(self.writers) if writer.metrics is not None ]
+        gauges = [
+            (f"writer_{key}", { "writer": str(i) }, value)
+            for i, writer in enumerate(self.writers)
+            for key, value in writer.get_stats().items()
+        ]
+        return format_metrics(metrics, gauges)
+
+    async def _handle_metrics_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        minimal HTTP/1.0: any GET is answered with the metrics, then the connection is closed
+        '''
+        try:
+            request_line = await reader.readline()
+            # skip headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            if request_line.startswith(b"GET "):
+                body = self.get_metrics().encode('utf-8')
+                header = f"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\n\r\n"
+            else:
+                body = b""
+                header = "HTTP/1.0 405 Method Not Allowed\r\nContent-Length: 0\r\n\r\n"
+
+            writer.write(header.encode('ascii') + body)
+            await writer.drain()
+        except (ConnectionError, OSError) as err:
+            logging.info(f"Metrics connection lost: {err}")
+        finally:
+            writer.close()
+
+    def _select_samplers(self, request: dict) -> dict[str, Sampler]:
+        '''
+        samplers addressed by the request (all of them if no device is given)
+        '''
+        device_id = request.get("device")
+        if device_id is None:
+            return self.samplers
+
+        if device_id not in self.samplers:
+            raise RuntimeError(f"unknown device: {device_id}")
+        if self.merged_writer is not None:
+            raise RuntimeError("output of all devices is merged, runs cannot be addressed to one device")
+
+        return { device_id: self.samplers[device_id] }
+
+    def _add_marker(self, request: dict, received_time: float):
+        try:
+            samplers = self._select_samplers(request)
+        except RuntimeError as err:
+            logging.info(f"Marker ignored: {err}")
+            return
+
+        for device_id, sampler in samplers.items():
+            if not sampler.add_marker(request["name"], received_time, request.get("client_time")):
+                logging.info(f"Marker {request['name']} ignored: no measurement running on {device_id}")
+
+    def _start_measurement(self, filename: str, samplers: dict[str, Sampler], clock: Optional[dict] = None) -> dict[str, Optional[float]]:
+        '''
+        returns device id -> timestamp of its first sample
+        (None for a device stopped before it, every device is stopped then)
+        '''
+        t0 = None
+        if len(samplers) > 1:
+            t0 = time.perf_counter() + START_LEAD_TIME
+
+        # rejected before anything is opened: a START during a run must not touch its files
+        # (requests are executed one at a time, so no sampler can be armed in between)
+        busy = [ device_id for device_id, sampler in samplers.items() if sampler.get_state() in (SamplerState.ARMED, SamplerState.RUNNING) ]
+        if busy:
+            raise RuntimeError(f"a measurement is already running on {busy}")
+
+        if self.merged_writer is not None:
+            sampler = next(iter(samplers.values()))
+            titles = merged_titles(list(samplers), sampler.get_titles())
+            self.merged_writer.check_output_file(filename, sampler.output_format)
+            self.merged_writer.open(filename, titles, sampler.output_format)
+            self._merged_filename = filename
+
+        armed = {}
+        try:
+            for device_id, sampler in samplers.items():
+                device_filename = filename
+                if len(samplers) > 1 and self.merged_writer is None:
+                    root, ext = os.path.splitext(filename)
+                    device_filename = f"{root}_{device_id}{ext}"
+
+                sampler.arm(device_filename, t0, clock=clock)
+                armed[device_id] = sampler
+        except RuntimeError:
+            if armed:
+                self._stop_measurement(armed)
+            elif self.merged_writer is not None:
+                # opened above for this run only
+                self.merged_writer.close()
+                self._merged_filename = None
+            raise
+
+        first_sample_times = { device_id: sampler.wait_for_first_sample() for device_id, sampler in samplers.items() }
+        if None in first_sample_times.values():
+            # the START fails: the devices that did start must not keep sampling into its file
+            self._stop_measurement(samplers)
+
+        return first_sample_times
+
+    def _stop_measurement(self, samplers: dict[str, Sampler]) -> dict[str, dict]:
+        '''
+        returns device id -> energy / power summary of its run
+        '''
+        summaries = {}
+        for device_id, sampler in samplers.items():
+            summary = sampler.stop_measurement()
+            if summary is not None:
+                summaries[device_id] = summary
+
+        # no sampler addressed: the merged file (if any) is not this request's
+        if self.merged_writer is not None and samplers:
+            writer_error = self.merged_writer.close().wait()
+            if writer_error is not None:
+                for summary in summaries.values():
+                    summary["writer_error"] = writer_error
+            if self._merged_filename is not None and summaries:
+                try:
+                    write_summary(self._merged_filename, summaries)
+                except Exception as err:
+                    logging.error(f"Writing the summary of {self._merged_filename} failed: {err!r}")
+                    for summary in summaries.values():
+                        summary["summary_error"] = repr(err)
+            self._merged_filename = None
+
+        return summaries
+
+    def _handle_request(self, request: dict, received_time: float) -> dict:
+        command = request.get("command")
+
+        try:
+            if command == START:
+                samplers = self._select_samplers(request)
+                first_sample_times = self._start_measurement(request["filename"], samplers, request.get("clock"))
+                if None in first_sample_times.values():
+                    return { "ok": False, "error": "measurement stopped before the first sample" }
+
+                # time from receiving the command to taking the first sample
+                devices = {
+                    device_id: {
+                        "first_sample_time": first_sample_time,
+                        "start_latency": first_sample_time - received_time,
+                    }
+                    for device_id, first_sample_time in first_sample_times.items()
+                }
+                first_sample_time = max(first_sample_times.values())
+                start_latency = first_sample_time - received_time
+                logging.info(f"Start new measurement on {list(devices)} (start latency: {start_latency * 1000:.3f} ms)")
+                return {
+                    "ok": True,
+                    "first_sample_time": first_sample_time,
+                    "start_latency": start_latency,
+                    "devices": devices,
+                }
+            elif command == STOP:
+                samplers = self._select_samplers(request)
+                summaries = self._stop_measurement(samplers)
+                logging.info(f"Stop measurement on {list(samplers)}")
+                reply = { "ok": True, "summaries": summaries }
+                # runs ended early by an error (their summaries cover what was sampled)
+                # or whose samples / summary could not all be written
+                errors = {}
+                for device_id, summary in summaries.items():
+                    device_errors = [ summary[key] for key in ("error", "writer_error", "summary_error") if key in summary ]
+                    if device_errors:
+                        errors[device_id] = "; ".join(device_errors)
+                if errors:
+                    logging.error(f"Runs failed: {errors}")
+                    reply["errors"] = errors
+                return reply
+            elif command == STATS:
+                samplers = self._select_samplers(request)
+                statistics = { device_id: sampler.get_power_statistics() for device_id, sampler in samplers.items() }
+                return { "ok": True, "statistics": statistics }
+        except RuntimeError as err:
+            return { "ok": False, "error": str(err) }
+
+        return { "ok": False, "error": f"unknown command: {command}" }
+
+    def _shutdown_samplers(self):
+        for sampler in self.samplers.values():
+            sampler.shutdown()
 
     def run(self):
-        # 3 workers
-        # - 1 for socket server
-        # - 1 for taking measurement
-        # - 1 for recording measurement
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            run_server_future = executor.submit(self.run_server)
-            measure_future = executor.submit(self.sampler.measure, self.stop_event, self.pause_event)
+        # workers
+        # - 1 per device for taking measurement
+        # - 1 per writer for recording measurement
+        # - 1 for executing requests, one at a time
+        #   (socket server itself runs on the event loop of the main thread)
+        with ThreadPoolExecutor(max_workers=len(self.samplers) + len(self.writers) + 1) as executor:
+            self._executor = executor
+            measure_futures = [ executor.submit(sampler.measure) for sampler in self.samplers.values() ]
+            write_futures = [ executor.submit(writer.write) for writer in self.writers ]
 
             try:
-                for future in as_completed([run_server_future, measure_future]):
-                    future.result()
-            except KeyboardInterrupt:
-                logging.debug("KeyboardInterrupt captured!")
+                asyncio.run(self.run_server())
+            finally:
+                # measuring threads stop their writers, which record
+                # all remaining measured values before they end
                 self.stop_event.set()
-                self.sampler.close()
-                logging.info("⚠️\tWait for all measured values to be recorded before stopping the socket server.")
-                logging.info("⚠️\tAfter that, ^C twice to stop the socket server.")
+                self._shutdown_samplers()
 
-        logging.info("All threads ended.")
+                for future in measure_futures:
+                    # a measuring thread that died has stopped its writer as well (see Sampler.measure)
+                    try:
+                        future.result()
+                    except Exception as err:
+                        logging.error(f"Measuring thread failed: {err!r}")
+                if self.merged_writer is not None:
+                    self.merged_writer.stop()
+                for future in write_futures:
+                    future.result()
 
+                for sampler in self.samplers.values():
+                    sampler.close()
 
+        logging.info("All threads ended.")
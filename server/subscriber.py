@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from protocol import sample_frame
+from protocol.protocol import encode_frame
+from writer.writer import WriterListener
+
+# what to do when a subscriber does not keep up and its buffer is full
+# - drop oldest: discard the oldest buffered frame (subscriber sees a gap)
+# - disconnect:  close the connection of the slow subscriber
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, DISCONNECT)
+
+DEFAULT_MAX_BUFFERED_FRAMES = 256
+
+
+class Subscriber():
+    '''
+    Buffers frames for one subscribed client.
+
+    Frames are pushed from the writer thread and sent by a coroutine on
+    the server's event loop, so that a slow client never blocks the writer
+    (nor the sampler).
+    '''
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        stream_writer: asyncio.StreamWriter,
+        addr,
+        policy: str = DROP_OLDEST,
+        max_buffered_frames: int = DEFAULT_MAX_BUFFERED_FRAMES,
+    ) -> None:
+        self.loop = loop
+        self.stream_writer = stream_writer
+        self.addr = addr
+        self.policy = policy
+        self.max_buffered_frames = max_buffered_frames
+
+        self._frames = deque()
+        self._lock = threading.Lock()
+        # set (on the event loop) when frames are buffered or the subscriber is closed
+        self._wakeup = asyncio.Event()
+        self.closed = False
+
+        self.num_sent = 0
+        self.num_dropped = 0
+
+    def push(self, frame: bytes):
+        '''
+        never blocks, can be called from any thread
+        '''
+        with self._lock:
+            if self.closed:
+                return
+
+            if len(self._frames) >= self.max_buffered_frames:
+                if self.policy == DISCONNECT:
+                    logging.info(f"Subscriber {self.addr} is too slow, disconnecting")
+                    self._close()
+                    return
+
+                self._frames.popleft()
+                self.num_dropped += 1
+
+            self._frames.append(frame)
+
+        self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def send(self):
+        '''
+        runs on the event loop until the connection is closed
+        '''
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                with self._lock:
+                    if self.closed:
+                        break
+                    frames = list(self._frames)
+                    self._frames.clear()
+
+                self.stream_writer.write(b"".join(encode_frame(frame) for frame in frames))
+                await self.stream_writer.drain()
+                self.num_sent += len(frames)
+        except (ConnectionError, OSError) as err:
+            logging.info(f"Subscriber {self.addr} disconnected: {err}")
+        finally:
+            self.close()
+
+        logging.info(f"Subscriber {self.addr}: sent {self.num_sent} frames, dropped {self.num_dropped} frames")
+
+    def close(self):
+        '''
+        can be called from any thread
+        '''
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self._frames.clear()
+        # abort() also unblocks send() if it is waiting in drain()
+        self.loop.call_soon_threadsafe(self._wakeup.set)
+        self.loop.call_soon_threadsafe(self.stream_writer.transport.abort)
+
+
+class SubscriberHub():
+    '''
+    Encodes every batch handled by the writers once and
+    pushes it to the buffer of every subscriber.
+
+    Every writer feeds the hub through its own listener (see listener()),
+    so that the frames carry the id of the device they come from.
+    '''
+    def __init__(self, policy: str = DROP_OLDEST) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, got {policy}")
+
+        self.policy = policy
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def listener(self, device_id: str) -> WriterListener:
+        '''
+        to add to the writer of device_id
+        '''
+        return _DeviceFeed(self, device_id)
+
+    async def subscribe(self, stream_writer: asyncio.StreamWriter, addr):
+        '''
+        sends frames to the subscriber until it disconnects
+        '''
+        subscriber = Subscriber(asyncio.get_running_loop(), stream_writer, addr, policy=self.policy)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        logging.info(f"New subscriber: {addr}")
+
+        await subscriber.send()
+
+    def close(self):
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def publish(self, frame: bytes):
+        with self._lock:
+            self._subscribers = [ s for s in self._subscribers if not s.closed ]
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            subscriber.push(frame)
+
+
+class _DeviceFeed(WriterListener):
+    '''
+    Publishes the records of the writer of one device to the hub.
+    '''
+    def __init__(self, hub: SubscriberHub, device_id: str) -> None:
+        self.hub = hub
+        self.device_id = device_id
+        # also checks that the device id fits in a frame
+        self._close_frame = sample_frame.encode_close(device_id)
+
+    def on_open(self, filename: str, titles: tuple[str, ...]):
+        if self.hub.has_subscribers():
+            self.hub.publish(sample_frame.encode_open(self.device_id, filename, titles))
+
+    def on_batch(self, records: list[tuple[float, ...]]):
+        # no encoding cost without subscribers
+        if self.hub.has_subscribers():
+            self.hub.publish(sample_frame.encode_samples(self.device_id, records))
+
+    def on_close(self):
+        if self.hub.has_subscribers():
+            self.hub.publish(self._close_frame)
@@ -1,11 +1,19 @@
 
 import argparse
+import queue
 from logging import DEBUG, INFO
 
 from device_controller.kikusui import Kikusui
-from sampler.sampler import Sampler
+from sampler.alignment import channel_time_titles
+from sampler.sampler import DEFAULT_MAX_QUEUE_SIZE, Sampler
+from sampler.scheduler import POLICIES, SKIP
+from sampler.trigger import DEFAULT_POST_TRIGGER, DEFAULT_PRE_TRIGGER, DEFAULT_SUMMARY_INTERVAL, TriggerRecorder
 from server.server import Server
 from utils.utils import enable_logging
+from writer.merging_writer import MergingWriter
+from writer.pyramid import DEFAULT_WIDTHS
+from writer.sample_log import DEFAULT_SYNC_BYTES, DEFAULT_SYNC_INTERVAL, recover_all
+from writer.writer import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS
 
 PUBLIC_HOST = "0.0.0.0"
 LOCALHOST = "127.0.0.1"
@@ -55,35 +63,210 @@ def parse_args():
         help=f"set sampling interval in seconds (default: {DEFAULT_SAMPLING_INTERVAL} s)"
     )
 
+    parser.add_argument(
+        "--separate_queries",
+        action="store_true",
+        default=False,
+        help="set --separate_queries to query current and voltage in 2 separate messages instead of 1 compound message (default: False)"
+    )
+
     parser.add_argument(
         "--device_id",
-        required=True,
-        help="set which measuring device to use. Choose from [14, 15, 21, 87]"
+        nargs="+",
+        default=[],
+        help="set which measuring device(s) to use, each one is sampled by its own thread. Choose from [14, 15, 21, 87]"
+    )
+
+    parser.add_argument(
+        "--address",
+        nargs="+",
+        default=[],
+        help="set VISA address(es) of measuring device(s) to use in addition to --device_id, as <device id>=<address> or <address> (device id: visa0, visa1, ...), e.g. pmx=TCPIP0::127.0.0.1::5025::SOCKET for pmx_emulator_app.py"
+    )
+
+    parser.add_argument(
+        "--merge_output",
+        action="store_true",
+        default=False,
+        help="set --merge_output to record all devices in one time-aligned file instead of one file per device (default: False)"
+    )
+
+    parser.add_argument(
+        "--channel_timestamps",
+        action="store_true",
+        default=False,
+        help="set --channel_timestamps to also record when the query of every channel (current, voltage) started / ended (default: False)"
+    )
+
+    parser.add_argument(
+        "--align_channels",
+        action="store_true",
+        default=False,
+        help="set --align_channels to compute power / energy from current and voltage interpolated onto the same instant (default: False)"
+    )
+
+    parser.add_argument(
+        "--trigger_power",
+        type=float,
+        default=None,
+        help="set a power in W to only record windows (every sample, taken each --sampling_interval) around samples at or above it, and summary rows the rest of the time (default: record every sample)"
+    )
+
+    parser.add_argument(
+        "--trigger_di_dt",
+        type=float,
+        default=None,
+        help="set a |dI/dt| in A/s to only record windows (every sample, taken each --sampling_interval) around samples at or above it, and summary rows the rest of the time (default: record every sample)"
+    )
+
+    parser.add_argument(
+        "--pre_trigger",
+        type=float,
+        default=DEFAULT_PRE_TRIGGER,
+        help=f"set how many seconds before a trigger are recorded (default: {DEFAULT_PRE_TRIGGER} s)"
+    )
+
+    parser.add_argument(
+        "--post_trigger",
+        type=float,
+        default=DEFAULT_POST_TRIGGER,
+        help=f"set how many seconds after a trigger are recorded (default: {DEFAULT_POST_TRIGGER} s)"
+    )
+
+    parser.add_argument(
+        "--summary_interval",
+        type=float,
+        default=DEFAULT_SUMMARY_INTERVAL,
+        help=f"set the seconds of samples averaged into one summary row outside trigger windows (default: {DEFAULT_SUMMARY_INTERVAL} s)"
+    )
+
+    parser.add_argument(
+        "--log_sync_interval",
+        type=float,
+        default=DEFAULT_SYNC_INTERVAL,
+        help=f"set the seconds of records the log output format may lose on power loss (fsync at least that often, default: {DEFAULT_SYNC_INTERVAL} s)"
+    )
+
+    parser.add_argument(
+        "--log_sync_bytes",
+        type=int,
+        default=DEFAULT_SYNC_BYTES,
+        help=f"set the bytes of records the log output format buffers at most before an fsync (default: {DEFAULT_SYNC_BYTES})"
+    )
+
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=None,
+        help="set a port to serve stage timings and counters of the samplers on http://127.0.0.1:<port>/metrics (default: not instrumented)"
+    )
+
+    parser.add_argument(
+        "--pyramid",
+        type=float,
+        nargs="*",
+        default=None,
+        help=f"set --pyramid [WIDTH ...] to index every sample file with min / max / mean over time buckets for plotting (default widths: {' '.join(map(str, DEFAULT_WIDTHS))} s)"
+    )
+
+    parser.add_argument(
+        "--schedule_policy",
+        choices=POLICIES,
+        default=SKIP,
+        help=f"set what to do when sampling deadlines are missed (default: {SKIP})"
+    )
+
+    parser.add_argument(
+        "--output_format",
+        choices=tuple(OUTPUT_FORMATS),
+        default=DEFAULT_OUTPUT_FORMAT,
+        help=f"set the format of the files storing measured values (default: {DEFAULT_OUTPUT_FORMAT})"
     )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.device_id and not args.address:
+        parser.error("set at least one --device_id or --address")
+    # device id -> VISA address (None -> USB address of the device id, see device_controller/device_info.py)
+    # addresses without an id get a short one, the id names the files of the device
+    args.addresses = { device_id: None for device_id in args.device_id }
+    num_unnamed = 0
+    for address in args.address:
+        device_id, _, visa_address = address.rpartition("=")
+        if not device_id:
+            device_id = f"visa{num_unnamed}"
+            num_unnamed += 1
+        if device_id in args.addresses:
+            parser.error(f"device id {device_id} is used twice")
+        args.addresses[device_id] = visa_address
+    args.trigger = args.trigger_power is not None or args.trigger_di_dt is not None
+    if args.trigger and args.merge_output:
+        parser.error("--trigger_power / --trigger_di_dt cannot be combined with --merge_output")
+    # --pyramid without widths -> default widths
+    if args.pyramid is not None:
+        args.pyramid = tuple(args.pyramid) or DEFAULT_WIDTHS
+
+    return args
 
 if __name__ == "__main__":
     args = parse_args()
     log_level = DEBUG if args.verbose else INFO
     enable_logging(level=log_level)
 
-    device_controller = Kikusui(device_id=args.device_id)
-    device_controller.set_output_voltage(args.output_voltage)
-    device_controller.set_output_current(args.output_current)
-    device_controller.output_on()
+    # logs cut short by a crash of the previous server (see writer/sample_log.py)
+    recover_all()
+
+    device_controllers = {}
+    for device_id, address in args.addresses.items():
+        device_controller = Kikusui(device_id=device_id, combined_query=not args.separate_queries, address=address)
+        device_controller.set_output_voltage(args.output_voltage)
+        device_controller.set_output_current(args.output_current)
+        device_controller.output_on()
+        device_controllers[device_id] = device_controller
+
+    sink_options = { "log": { "sync_interval": args.log_sync_interval, "sync_bytes": args.log_sync_bytes } }
+
+    # all devices share one writer when their output is merged
+    merged_writer = None
+    if args.merge_output and len(device_controllers) > 1:
+        titles = tuple(device_controller.get_titles())
+        if args.channel_timestamps:
+            titles += channel_time_titles(titles)
+        merged_writer = MergingWriter(
+            queue.Queue(maxsize=DEFAULT_MAX_QUEUE_SIZE),
+            device_ids=list(device_controllers),
+            num_columns=len(titles),
+            sink_options=sink_options,
+        )
+
+    samplers = {
+        device_id: Sampler(
+            device_controller=device_controller,
+            output_filename='test.csv',
+            sampling_interval=args.sampling_interval,
+            schedule_policy=args.schedule_policy,
+            output_format=args.output_format,
+            device_id=device_id,
+            writer=merged_writer,
+            channel_timestamps=args.channel_timestamps,
+            align_channels=args.align_channels,
+            trigger=TriggerRecorder(
+                args.trigger_power, args.trigger_di_dt, args.pre_trigger, args.post_trigger, args.summary_interval
+            ) if args.trigger else None,
+            sink_options=sink_options,
+        )
+        for device_id, device_controller in device_controllers.items()
+    }
 
     host = PUBLIC_HOST if args.allow_public else LOCALHOST
     port = PORT
 
     s = Server(
-        sampler=Sampler(
-            device_controller=device_controller,
-            output_filename='test.csv',
-            sampling_interval=args.sampling_interval
-        ),
+        samplers=samplers,
         host=host,
         port=port,
+        merged_writer=merged_writer,
+        pyramid_widths=args.pyramid,
+        metrics_port=args.metrics_port,
     )
 
     s.run()
@@ -16,3 +16,8 @@ def write_csv(csv: TextIOWrapper, items: list[Any]):
     row = ", ".join(map(str, items))
     csv.write(f"{row}\n")
     csv.flush()
+
+def write_csv_rows(csv: TextIOWrapper, rows: list[list[Any]]):
+    lines = "".join(f"{', '.join(map(str, items))}\n" for items in rows)
+    csv.write(lines)
+    csv.flush()
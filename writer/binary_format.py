@@ -0,0 +1,129 @@
+# Fixed-record binary format for sample files
+#
+#   | offset | size        | content                                          |
+#   | ---    | ---         | ---                                              |
+#   | 0      | header      | magic: b"PMPISMPL", titles (see writer/sink.py)  |
+#   | header | 8 * columns | records: 1 float64 per column, little endian     |
+#
+# The first column is the timestamp (perf_counter of the supervisor),
+# the other columns follow the titles of the device controller
+# (e.g. device_controller/kikusui.json).
+# The header size is a multiple of 8, so records are aligned for NumPy.
+#
+# The number of records is not stored in the header, it is derived from
+# the file size. A file cut short by a crash is therefore readable up to
+# its last complete record.
+
+import mmap
+import os
+from typing import Iterator
+
+from writer.sink import Sink, csv_to_sink, encode_header, read_header, record_struct, records_to_csv
+
+MAGIC = b"PMPISMPL"
+VERSION = 1
+
+
+class BinarySink(Sink):
+    extension = ".bin"
+
+    def __init__(self, filename: str, titles: tuple[str, ...]) -> None:
+        self.filename = filename
+        self.titles = titles
+        self._record = record_struct(len(titles))
+
+        self._file = open(filename, 'wb')
+        self._file.write(encode_header(MAGIC, VERSION, titles))
+        self._file.flush()
+
+    def write_batch(self, records: list[tuple[float, ...]]):
+        pack = self._record.pack
+        self._file.write(b"".join(pack(*record) for record in records))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BinaryReader():
+    '''
+    Read-only, memory-mapped view of a binary sample file.
+
+    reader[i] / iter(reader) -> tuples of floats
+    reader.to_numpy()        -> (num_records, num_columns) float64 array
+                                sharing memory with the file (zero-copy)
+    '''
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._file = open(filename, 'rb')
+
+        self.titles, num_columns, header_size = read_header(self._file, filename, MAGIC, VERSION)
+        self.num_columns = num_columns
+        self.header_size = header_size
+        self._record = record_struct(num_columns)
+
+        file_size = os.fstat(self._file.fileno()).st_size
+        # ignore a partially written last record
+        self.num_records = max(0, file_size - header_size) // self._record.size
+
+        self._mmap = None
+        if self.num_records > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.num_records
+
+    def __getitem__(self, i: int) -> tuple[float, ...]:
+        if i < 0:
+            i += self.num_records
+        if not 0 <= i < self.num_records:
+            raise IndexError(i)
+
+        return self._record.unpack_from(self._mmap, self.header_size + i * self._record.size)
+
+    def __iter__(self) -> Iterator[tuple[float, ...]]:
+        if self._mmap is None:
+            return iter(())
+
+        end = self.header_size + self.num_records * self._record.size
+        return self._record.iter_unpack(memoryview(self._mmap)[self.header_size:end])
+
+    def to_numpy(self):
+        '''
+        requires numpy, the array is only valid until close()
+        '''
+        import numpy as np
+
+        if self._mmap is None:
+            return np.empty((0, self.num_columns), dtype='<f8')
+
+        return np.frombuffer(
+            self._mmap,
+            dtype='<f8',
+            count=self.num_records * self.num_columns,
+            offset=self.header_size,
+        ).reshape(self.num_records, self.num_columns)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+def csv_to_binary(csv_filename: str, binary_filename: str, titles: tuple[str, ...]):
+    '''
+    titles: the CSV files written by the sampler have no title row
+    '''
+    csv_to_sink(csv_filename, BinarySink(binary_filename, titles))
+
+
+def binary_to_csv(binary_filename: str, csv_filename: str):
+    with BinaryReader(binary_filename) as reader:
+        records_to_csv(reader, csv_filename)
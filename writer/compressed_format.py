@@ -0,0 +1,262 @@
+# Compressed block format for sample files (e.g. long runs on SD cards)
+#
+#   | offset | size        | content                                            |
+#   | ---    | ---         | ---                                                |
+#   | 0      | header      | magic: b"PMPICMPR", titles (see writer/sink.py)    |
+#   | header | ...         | blocks                                             |
+#
+# Every block holds up to BLOCK_SIZE records and can be decoded on its own:
+#
+#   | 4     | number of records (uint32)                          |
+#   | 4     | size of the compressed payload in bytes (uint32)    |
+#   | 8     | timestamp of the first record (float64)             |
+#   | 8     | timestamp of the last record (float64)              |
+#   | ...   | payload (zlib)                                      |
+#
+# Payload: column after column,
+#
+#   | 1     | decimals: 0..MAX_DECIMALS, or RAW                   |
+#   | 8 * n | differences (uint64, wrapping) of every value with  |
+#   |       | the previous value of the column (the first with 0) |
+#
+# - decimals: every value of the column in the block has at most that many decimals
+#   (e.g. readings of the meter: "2.5012"), values are encoded as integers (value * 10^decimals)
+# - RAW: values are encoded as their float64 bit patterns (e.g. timestamps)
+#
+# differences are stored byte plane after byte plane (all lowest bytes first, ...),
+# so the mostly zero high bytes of small differences compress well. Lossless.
+#
+# Blocks are written when full or when their first record is BLOCK_INTERVAL seconds old
+# (records of the current block are lost on a crash), so the card is written rarely.
+
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator
+
+from writer.sink import Sink, csv_to_sink, encode_header, read_header, records_to_csv
+
+MAGIC = b"PMPICMPR"
+VERSION = 1
+_BLOCK_HEADER = struct.Struct("<IIdd")
+
+BLOCK_SIZE = 4096 # records
+BLOCK_INTERVAL = 10.0 # sec (timestamps of the records)
+COMPRESSION_LEVEL = 6
+
+MAX_DECIMALS = 6
+RAW = 255
+
+_MASK = (1 << 64) - 1
+_SIGN = 1 << 63
+
+
+def _decimals(values: list[float]) -> int:
+    '''
+    fewest decimals representing every value exactly (RAW if more than MAX_DECIMALS)
+    '''
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10 ** decimals
+        try:
+            if all(round(value * scale) / scale == value for value in values):
+                return decimals
+        except (OverflowError, ValueError):
+            # inf / nan
+            return RAW
+
+    return RAW
+
+
+def encode_block(records: list[tuple[float, ...]], num_columns: int) -> bytes:
+    payload = []
+    for column in range(num_columns):
+        values = [ record[column] for record in records ]
+        decimals = _decimals(values)
+        if decimals == RAW:
+            integers = array('Q', array('d', values).tobytes())
+        else:
+            scale = 10 ** decimals
+            integers = [ round(value * scale) for value in values ]
+
+        deltas = array('Q', bytes(8 * len(values)))
+        previous = 0
+        for i, value in enumerate(integers):
+            deltas[i] = (value - previous) & _MASK
+            previous = value
+
+        raw = deltas.tobytes()
+        payload.append(bytes([ decimals ]))
+        payload += [ raw[i::8] for i in range(8) ]
+
+    compressed = zlib.compress(b"".join(payload), COMPRESSION_LEVEL)
+    return _BLOCK_HEADER.pack(len(records), len(compressed), records[0][0], records[-1][0]) + compressed
+
+
+def decode_block(num_records: int, num_columns: int, compressed: bytes) -> list[tuple[float, ...]]:
+    payload = zlib.decompress(compressed)
+    column_size = 1 + 8 * num_records
+
+    columns = []
+    for column in range(num_columns):
+        decimals = payload[column * column_size]
+        planes = payload[column * column_size + 1:(column + 1) * column_size]
+        raw = bytearray(8 * num_records)
+        for i in range(8):
+            raw[i::8] = planes[i * num_records:(i + 1) * num_records]
+
+        integers = array('Q', bytes(raw))
+        previous = 0
+        for i, delta in enumerate(integers):
+            previous = (previous + delta) & _MASK
+            integers[i] = previous
+
+        if decimals == RAW:
+            columns.append(array('d', integers.tobytes()))
+        else:
+            scale = 10 ** decimals
+            columns.append([ (value - (1 << 64) if value & _SIGN else value) / scale for value in integers ])
+
+    return list(zip(*columns))
+
+
+class CompressedSink(Sink):
+    extension = ".pmz"
+
+    def __init__(self, filename: str, titles: tuple[str, ...]) -> None:
+        self.filename = filename
+        self.titles = titles
+        self.num_columns = len(titles)
+        self._block = []
+
+        self._file = open(filename, 'wb')
+        self._file.write(encode_header(MAGIC, VERSION, titles))
+        self._file.flush()
+
+    def write_batch(self, records: list[tuple[float, ...]]):
+        for record in records:
+            self._block.append(record)
+            if len(self._block) >= BLOCK_SIZE:
+                self._write_block()
+
+        if self._block and self._block[-1][0] - self._block[0][0] >= BLOCK_INTERVAL:
+            self._write_block()
+
+    def _write_block(self):
+        self._file.write(encode_block(self._block, self.num_columns))
+        self._file.flush()
+        self._block = []
+
+    def close(self):
+        if self._block:
+            self._write_block()
+        self._file.close()
+
+
+class CompressedReader():
+    '''
+    Reads the block headers only when opened, a block is decompressed
+    when one of its records is accessed (the last decoded block is cached).
+
+    reader[i] / iter(reader) -> tuples of floats
+    reader.read_range(start_time, end_time) -> records in the range
+    '''
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._file = open(filename, 'rb')
+
+        self.titles, num_columns, header_size = read_header(self._file, filename, MAGIC, VERSION)
+        self.num_columns = num_columns
+
+        # per block: offset of the payload, number of records, size, first / last timestamp
+        self.offsets = []
+        self.counts = []
+        self.sizes = []
+        self.first_times = []
+        self.last_times = []
+        # index of the first record of every block
+        self.starts = []
+
+        file_size = os.fstat(self._file.fileno()).st_size
+        offset = header_size
+        num_records = 0
+        while offset + _BLOCK_HEADER.size <= file_size:
+            self._file.seek(offset)
+            count, size, first_time, last_time = _BLOCK_HEADER.unpack(self._file.read(_BLOCK_HEADER.size))
+            # ignore a partially written last block
+            if offset + _BLOCK_HEADER.size + size > file_size:
+                break
+
+            self.offsets.append(offset + _BLOCK_HEADER.size)
+            self.counts.append(count)
+            self.sizes.append(size)
+            self.first_times.append(first_time)
+            self.last_times.append(last_time)
+            self.starts.append(num_records)
+            num_records += count
+            offset += _BLOCK_HEADER.size + size
+
+        self.num_records = num_records
+        self._cached_block = None
+        self._cached_records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.num_records
+
+    def num_blocks(self) -> int:
+        return len(self.offsets)
+
+    def read_block(self, block: int) -> list[tuple[float, ...]]:
+        if block != self._cached_block:
+            self._file.seek(self.offsets[block])
+            self._cached_records = decode_block(self.counts[block], self.num_columns, self._file.read(self.sizes[block]))
+            self._cached_block = block
+
+        return self._cached_records
+
+    def __getitem__(self, i: int) -> tuple[float, ...]:
+        if i < 0:
+            i += self.num_records
+        if not 0 <= i < self.num_records:
+            raise IndexError(i)
+
+        block = bisect_right(self.starts, i) - 1
+        return self.read_block(block)[i - self.starts[block]]
+
+    def __iter__(self) -> Iterator[tuple[float, ...]]:
+        for block in range(self.num_blocks()):
+            yield from self.read_block(block)
+
+    def read_range(self, start_time: float, end_time: float) -> list[tuple[float, ...]]:
+        '''
+        only the blocks overlapping the range are decompressed
+        '''
+        records = []
+        first = bisect_left(self.last_times, start_time)
+        last = bisect_right(self.first_times, end_time)
+        for block in range(first, last):
+            records += [ r for r in self.read_block(block) if start_time <= r[0] <= end_time ]
+
+        return records
+
+    def close(self):
+        self._file.close()
+
+
+def compressed_to_csv(compressed_filename: str, csv_filename: str):
+    with CompressedReader(compressed_filename) as reader:
+        records_to_csv(reader, csv_filename, batch_size=BLOCK_SIZE)
+
+
+def csv_to_compressed(csv_filename: str, compressed_filename: str, titles: tuple[str, ...]):
+    '''
+    titles: of the CSV columns (see csv_to_sink)
+    '''
+    csv_to_sink(csv_filename, CompressedSink(compressed_filename, titles), batch_size=BLOCK_SIZE)
@@ -0,0 +1,91 @@
+import queue
+
+from writer.writer import SampleWriter
+
+# a tick still missing samples of some devices is written anyway
+# once this many newer ticks are waiting
+DEFAULT_MAX_PENDING_TICKS = 64
+
+
+def merged_titles(device_ids: list[str], titles: tuple[str, ...]) -> tuple[str, ...]:
+    return tuple(f"{title} ({device_id})" for device_id in device_ids for title in titles)
+
+
+class MergingWriter(SampleWriter):
+    '''
+    Writes the samples of several samplers (one per device) as one stream.
+
+    All samplers share t0 and the sampling interval, so the samples taken
+    at the same tick (t0 + n * interval) are joined into one row:
+        ( epoch, current, voltage ) of device 1, ( ... ) of device 2, ...
+    Columns of a device that missed a tick are NaN.
+
+    The samplers only put samples, opening/closing files and stopping
+    is done by the owner of the writer (the server).
+    '''
+    def __init__(
+        self,
+        sample_queue: queue.Queue,
+        device_ids: list[str],
+        num_columns: int,
+        max_pending_ticks: int = DEFAULT_MAX_PENDING_TICKS,
+        **kwargs,
+    ) -> None:
+        super().__init__(sample_queue, **kwargs)
+
+        self.device_ids = list(device_ids)
+        self.num_columns = num_columns
+        self.max_pending_ticks = max_pending_ticks
+
+        # tick -> { device_id: sample }
+        self._pending = {}
+        # ticks up to this one have been written
+        self._merged_until = -1
+        self.num_late = 0
+
+    def put_sample(self, values: tuple[float, ...], tick: int, device_id: str = None):
+        self.put((device_id, tick, values))
+
+    def _add_record(self, record: tuple):
+        device_id, tick, values = record
+
+        if tick <= self._merged_until:
+            # its row has already been written with NaN for this device
+            self.num_late += 1
+            return
+
+        samples = self._pending.get(tick)
+        if samples is None:
+            samples = self._pending[tick] = {}
+        samples[device_id] = values
+
+        if len(samples) == len(self.device_ids):
+            # every device delivers its ticks in order:
+            # older ticks that are still incomplete will never be completed
+            self._merge_until(tick)
+        elif len(self._pending) > self.max_pending_ticks:
+            self._merge_until(min(self._pending))
+
+    def _merge_until(self, last_tick: int):
+        missing = (float('nan'),) * self.num_columns
+
+        for tick in sorted(t for t in self._pending if t <= last_tick):
+            samples = self._pending.pop(tick)
+            row = ()
+            for device_id in self.device_ids:
+                row += samples.get(device_id, missing)
+            super()._add_record(row)
+            self._merged_until = tick
+
+    def _open_output_file(self, item):
+        # ticks start from 0 again for every run
+        self._pending = {}
+        self._merged_until = -1
+
+        super()._open_output_file(item)
+
+    def _close_output_file(self):
+        if self._pending:
+            self._merge_until(max(self._pending))
+
+        super()._close_output_file()
@@ -0,0 +1,306 @@
+# Multi-resolution min / max / mean index of a sample file, for plotting long traces
+#
+# Every level splits the timeline into buckets of a fixed width (e.g. 1 s, 10 s, 60 s);
+# a bucket holds, for every value column, the min / max / mean / count of the samples in it:
+#
+#   | start of bucket | min 1 | max 1 | mean 1 | count 1 | min 2 | ... |
+#
+# Buckets start at multiples of their width (on the timeline of the samples), so each
+# bucket of a level is made of whole buckets of the level below (widths must be multiples).
+#
+# The index is built by the writer thread while samples arrive (PyramidBuilder) and stored
+# next to the sample file on close (XXX.csv -> XXX.pyramid):
+#
+#   | offset | size        | content                                           |
+#   | ---    | ---         | ---                                               |
+#   | 0      | 8           | magic: b"PMPIPYRM"                                |
+#   | 8      | 4           | header size in bytes (uint32, little endian)      |
+#   | 12     | header - 12 | JSON: { titles, widths, buckets (per level) }     |
+#   | header | ...         | buckets of every level (float64, little endian),  |
+#   |        |             | finest level first                                |
+
+import json
+import math
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+from writer.binary_format import BinaryReader
+from writer.writer import WriterListener
+
+DEFAULT_WIDTHS = (1.0, 10.0, 60.0) # sec
+
+MAGIC = b"PMPIPYRM"
+_HEADER_SIZE_BYTES = 4
+
+# per value column in a bucket: min, max, mean, count
+_FIELDS = 4
+
+
+def pyramid_filename(filename: str) -> str:
+    '''
+    index of a sample file: XXX.csv -> XXX.pyramid
+    '''
+    return f"{os.path.splitext(filename)[0]}.pyramid"
+
+
+class _Bucket():
+    '''
+    min / max / sum / count per value column of the bucket being filled
+    '''
+    def __init__(self, index: int, num_values: int) -> None:
+        self.index = index
+        self.min = [ math.inf ] * num_values
+        self.max = [ -math.inf ] * num_values
+        self.sum = [ 0.0 ] * num_values
+        self.count = [ 0 ] * num_values
+
+    def add_values(self, values):
+        for i, value in enumerate(values):
+            # NaN: no sample of this column (e.g. merged files)
+            if value != value:
+                continue
+            if value < self.min[i]:
+                self.min[i] = value
+            if value > self.max[i]:
+                self.max[i] = value
+            self.sum[i] += value
+            self.count[i] += 1
+
+    def add_bucket(self, row: list[float]):
+        '''
+        row: finished bucket of the level below
+        '''
+        for i in range(len(self.count)):
+            count = int(row[1 + i * _FIELDS + 3])
+            if count == 0:
+                continue
+            self.min[i] = min(self.min[i], row[1 + i * _FIELDS])
+            self.max[i] = max(self.max[i], row[1 + i * _FIELDS + 1])
+            self.sum[i] += row[1 + i * _FIELDS + 2] * count
+            self.count[i] += count
+
+    def to_row(self, width: float) -> list[float]:
+        row = [ self.index * width ]
+        for i in range(len(self.count)):
+            if self.count[i] == 0:
+                row += [ math.nan, math.nan, math.nan, 0.0 ]
+            else:
+                row += [ self.min[i], self.max[i], self.sum[i] / self.count[i], float(self.count[i]) ]
+        return row
+
+
+class Pyramid():
+    '''
+    Buckets of every level, queryable while they are built (from any thread)
+    or loaded from the index of a sample file (see load).
+    '''
+    def __init__(self, titles: tuple[str, ...], widths: tuple[float, ...] = DEFAULT_WIDTHS) -> None:
+        for finer, coarser in zip(widths, widths[1:]):
+            ratio = coarser / finer
+            if ratio < 2 or abs(ratio - round(ratio)) > 1e-9:
+                raise ValueError(f"every width must be a multiple of the previous one, got {widths}")
+
+        self.titles = tuple(titles)
+        self.widths = tuple(widths)
+        # value columns (all but the timestamp)
+        self.num_values = len(titles) - 1
+        self.row_size = 1 + _FIELDS * self.num_values
+
+        # level -> flat array of its finished buckets, start of every bucket (for bisect)
+        self.levels = [ array('d') for _ in widths ]
+        self.starts = [ array('d') for _ in widths ]
+
+        # file of the samples (raw resolution), binary files only
+        self.sample_filename = None
+        self._lock = threading.Lock()
+
+    def append(self, level: int, row: list[float]):
+        with self._lock:
+            self.levels[level].extend(row)
+            self.starts[level].append(row[0])
+
+    def num_buckets(self, level: int) -> int:
+        return len(self.starts[level])
+
+    def select_level(self, start_time: float, end_time: float, num_points: int) -> Optional[int]:
+        '''
+        coarsest level with at least num_points buckets in the range
+        (None: the range is too short for any level, raw samples are needed)
+        '''
+        wanted_width = (end_time - start_time) / max(num_points, 1)
+        selected = None
+        for level, width in enumerate(self.widths):
+            if width <= wanted_width:
+                selected = level
+        return selected
+
+    def get_buckets(self, level: int, start_time: float, end_time: float) -> list[tuple[float, ...]]:
+        '''
+        buckets of the level overlapping [start_time, end_time] (bisect, no scan)
+        '''
+        width = self.widths[level]
+        with self._lock:
+            starts = self.starts[level]
+            first = bisect_right(starts, start_time - width)
+            last = bisect_right(starts, end_time)
+            rows = self.levels[level][first * self.row_size:last * self.row_size]
+
+        return [ tuple(rows[i:i + self.row_size]) for i in range(0, len(rows), self.row_size) ]
+
+    def query(self, start_time: float, end_time: float, num_points: int) -> tuple[Optional[float], list[tuple[float, ...]]]:
+        '''
+        data to plot the range with (about) num_points points per line, e.g. pixels of the plot:
+        returns (bucket width, buckets) of the right level, or (None, raw samples)
+        when zoomed in beyond the finest level and the samples are in a binary file
+        (otherwise the finest level is returned)
+        '''
+        level = self.select_level(start_time, end_time, num_points)
+        if level is None:
+            if self.sample_filename is not None:
+                return None, read_samples(self.sample_filename, start_time, end_time)
+            level = 0
+
+        return self.widths[level], self.get_buckets(level, start_time, end_time)
+
+    def save(self, filename: str):
+        with self._lock:
+            header = json.dumps({
+                "titles": list(self.titles),
+                "widths": list(self.widths),
+                "buckets": [ len(starts) for starts in self.starts ],
+            }).encode('utf-8')
+            header_size = len(MAGIC) + _HEADER_SIZE_BYTES + len(header)
+            padding = -header_size % 8
+
+            with open(filename, 'wb') as f:
+                f.write(MAGIC)
+                f.write((header_size + padding).to_bytes(_HEADER_SIZE_BYTES, 'little'))
+                f.write(header + b" " * padding)
+                for level in self.levels:
+                    level.tofile(f)
+
+    @classmethod
+    def load(cls, filename: str, sample_filename: Optional[str] = None) -> "Pyramid":
+        '''
+        sample_filename: binary sample file for raw samples (see query)
+        '''
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{filename}: not a pyramid file")
+            header_size = int.from_bytes(f.read(_HEADER_SIZE_BYTES), 'little')
+            header = json.loads(f.read(header_size - len(MAGIC) - _HEADER_SIZE_BYTES))
+
+            pyramid = cls(tuple(header["titles"]), tuple(header["widths"]))
+            for level, num_buckets in enumerate(header["buckets"]):
+                pyramid.levels[level].fromfile(f, num_buckets * pyramid.row_size)
+                pyramid.starts[level] = pyramid.levels[level][::pyramid.row_size]
+
+        if sample_filename is not None and sample_filename.endswith(".bin"):
+            pyramid.sample_filename = sample_filename
+        return pyramid
+
+
+def read_samples(filename: str, start_time: float, end_time: float) -> list[tuple[float, ...]]:
+    '''
+    samples of a binary sample file in [start_time, end_time] (bisect on the mapped file, no scan)
+    '''
+    with BinaryReader(filename) as reader:
+        timestamps = _Timestamps(reader)
+        first = bisect_left(timestamps, start_time)
+        last = bisect_right(timestamps, end_time)
+        return [ reader[i] for i in range(first, last) ]
+
+
+class _Timestamps():
+    '''
+    sequence view of the first column of a BinaryReader (for bisect)
+    '''
+    def __init__(self, reader: BinaryReader) -> None:
+        self.reader = reader
+
+    def __len__(self) -> int:
+        return len(self.reader)
+
+    def __getitem__(self, i: int) -> float:
+        return self.reader[i][0]
+
+
+class PyramidBuilder(WriterListener):
+    '''
+    Builds the pyramid of the file being written (on the writer thread)
+    and saves it next to the file when it is closed.
+    '''
+    def __init__(self, widths: tuple[float, ...] = DEFAULT_WIDTHS) -> None:
+        self.widths = tuple(widths)
+
+        # pyramid of the current (or last) file
+        self.pyramid = None
+        self._filename = None
+        # bucket being filled, per level
+        self._buckets = []
+        # columns of the timestamps: one per device in merged files (see writer/merging_writer.py)
+        self._time_columns = (0,)
+
+    def on_open(self, filename: str, titles: tuple[str, ...]):
+        self.pyramid = Pyramid(titles, self.widths)
+        if filename.endswith(".bin"):
+            self.pyramid.sample_filename = filename
+        self._filename = filename
+        self._buckets = [ None ] * len(self.widths)
+        # "epoch" or "epoch (<device id>)"
+        time_title = titles[0].split(" (")[0]
+        self._time_columns = tuple(i for i, title in enumerate(titles) if title.split(" (")[0] == time_title)
+
+    def _finish(self, level: int):
+        '''
+        stores the bucket being filled at level and passes it to the level above
+        '''
+        bucket = self._buckets[level]
+        self._buckets[level] = None
+        row = bucket.to_row(self.widths[level])
+        self.pyramid.append(level, row)
+
+        if level + 1 < len(self.widths):
+            index = math.floor(row[0] / self.widths[level + 1])
+            coarser = self._buckets[level + 1]
+            if coarser is not None and coarser.index != index:
+                self._finish(level + 1)
+                coarser = None
+            if coarser is None:
+                coarser = self._buckets[level + 1] = _Bucket(index, self.pyramid.num_values)
+            coarser.add_bucket(row)
+
+    def on_batch(self, records: list[tuple[float, ...]]):
+        if self.pyramid is None:
+            return
+
+        width = self.widths[0]
+        time_columns = self._time_columns
+        for record in records:
+            # merged files: NaN timestamp for a device that missed the tick, first device with a sample
+            timestamp = next((record[i] for i in time_columns if record[i] == record[i]), None)
+            if timestamp is None:
+                continue
+            index = math.floor(timestamp / width)
+            bucket = self._buckets[0]
+            if bucket is not None and bucket.index != index:
+                self._finish(0)
+                bucket = None
+            if bucket is None:
+                bucket = self._buckets[0] = _Bucket(index, self.pyramid.num_values)
+            bucket.add_values(record[1:])
+
+    def on_close(self):
+        if self.pyramid is None:
+            return
+
+        # partially filled buckets, finest first (each one completes the level above)
+        for level in range(len(self.widths)):
+            if self._buckets[level] is not None:
+                self._finish(level)
+
+        self.pyramid.save(pyramid_filename(self._filename))
+        self._filename = None
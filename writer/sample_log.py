@@ -0,0 +1,180 @@
+# Append-only sample log with checksummed records (durable on power loss)
+#
+#   | offset | size        | content                                             |
+#   | ---    | ---         | ---                                                 |
+#   | 0      | header      | magic: b"PMPISLOG", titles (see writer/sink.py)     |
+#   | header | 8 * columns | record: 1 float64 per column, little endian         |
+#   |        | 4           | CRC-32 of the record (uint32)                       |
+#   |        | ...         | next records                                        |
+#
+# Group commit: records are buffered in memory and written + fsync'ed together once
+# sync_interval seconds passed or sync_bytes are buffered since the last fsync
+# (and on close), i.e. at most that much is lost on power loss. The interval is also
+# enforced while no records arrive (the writer polls the sink, see Sink.poll);
+# records reach the sink once the writer flushes its batch (flush_interval, see writer/writer.py).
+#
+# After a crash, the tail of the file can be missing or corrupted:
+# recover() truncates the file after its last valid record.
+
+import glob
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Iterator, Optional
+
+from writer.sink import Sink, encode_header, read_header, record_struct, records_to_csv
+
+MAGIC = b"PMPISLOG"
+VERSION = 1
+_CRC = struct.Struct("<I")
+
+DEFAULT_SYNC_INTERVAL = 1.0 # sec
+DEFAULT_SYNC_BYTES = 256 * 1024
+
+
+def _fsync_directory(filename: str):
+    '''
+    makes the creation of the file itself durable
+    '''
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class LogSink(Sink):
+    extension = ".pml"
+
+    def __init__(
+        self,
+        filename: str,
+        titles: tuple[str, ...],
+        sync_interval: float = DEFAULT_SYNC_INTERVAL,
+        sync_bytes: int = DEFAULT_SYNC_BYTES,
+    ) -> None:
+        self.filename = filename
+        self.titles = titles
+        self.sync_interval = sync_interval
+        self.sync_bytes = sync_bytes
+        self._record = record_struct(len(titles))
+
+        self._file = open(filename, 'wb', buffering=0)
+        self._file.write(encode_header(MAGIC, VERSION, titles))
+        os.fsync(self._file.fileno())
+        _fsync_directory(filename)
+
+        # records not written / fsync'ed yet
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_sync = time.perf_counter()
+
+        self.num_records = 0
+        self.num_syncs = 0
+
+    def write_batch(self, records: list[tuple[float, ...]]):
+        pack = self._record.pack
+        for record in records:
+            encoded = pack(*record)
+            self._pending.append(encoded + _CRC.pack(zlib.crc32(encoded)))
+        self._pending_bytes += len(records) * (self._record.size + _CRC.size)
+        self.num_records += len(records)
+
+        if self._pending_bytes >= self.sync_bytes or time.perf_counter() - self._last_sync >= self.sync_interval:
+            self._sync()
+
+    def next_deadline(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return self._last_sync + self.sync_interval
+
+    def poll(self):
+        if self._pending and time.perf_counter() - self._last_sync >= self.sync_interval:
+            self._sync()
+
+    def _sync(self):
+        '''
+        one write and one fsync for all pending records
+        '''
+        if self._pending:
+            self._file.write(b"".join(self._pending))
+            os.fsync(self._file.fileno())
+            self.num_syncs += 1
+            self._pending = []
+            self._pending_bytes = 0
+        self._last_sync = time.perf_counter()
+
+    def close(self):
+        self._sync()
+        self._file.close()
+        logging.info(f"{self.filename}: {self.num_records} records, {self.num_syncs} fsyncs")
+
+
+def read_log_titles(filename: str) -> tuple[str, ...]:
+    with open(filename, 'rb') as f:
+        titles, _, _ = read_header(f, filename, MAGIC, VERSION)
+    return titles
+
+
+def read_log(filename: str) -> Iterator[tuple[float, ...]]:
+    '''
+    valid records of the log (stops at the first invalid one)
+    '''
+    with open(filename, 'rb') as f:
+        titles, num_columns, header_size = read_header(f, filename, MAGIC, VERSION)
+        record = record_struct(num_columns)
+        size = record.size + _CRC.size
+
+        while True:
+            data = f.read(size)
+            if len(data) < size:
+                break
+            encoded = data[:record.size]
+            if _CRC.unpack_from(data, record.size)[0] != zlib.crc32(encoded):
+                break
+            yield record.unpack(encoded)
+
+
+def recover(filename: str) -> int:
+    '''
+    truncates the log after its last valid record,
+    returns the number of bytes removed
+    '''
+    with open(filename, 'rb') as f:
+        titles, num_columns, header_size = read_header(f, filename, MAGIC, VERSION)
+        size = record_struct(num_columns).size + _CRC.size
+
+    num_records = sum(1 for _ in read_log(filename))
+    valid_size = header_size + num_records * size
+    file_size = os.path.getsize(filename)
+    if file_size == valid_size:
+        return 0
+
+    with open(filename, 'r+b') as f:
+        f.truncate(valid_size)
+        os.fsync(f.fileno())
+
+    logging.info(f"{filename}: recovered {num_records} records, truncated {file_size - valid_size} bytes")
+    return file_size - valid_size
+
+
+def recover_all(directory: str = ".") -> int:
+    '''
+    recovery scan of every log in directory (e.g. on restart after a crash),
+    returns the number of logs truncated
+    '''
+    num_truncated = 0
+    for filename in sorted(glob.glob(os.path.join(directory, f"*{LogSink.extension}"))):
+        try:
+            if recover(filename) > 0:
+                num_truncated += 1
+        except ValueError as err:
+            logging.info(f"Recovery skipped: {err}")
+
+    return num_truncated
+
+
+def log_to_csv(log_filename: str, csv_filename: str):
+    records_to_csv(read_log(log_filename), csv_filename)
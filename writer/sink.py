@@ -0,0 +1,157 @@
+# Header shared by the binary sample formats (binary, compressed, log):
+#
+#   | offset | size        | content                                  |
+#   | ---    | ---         | ---                                      |
+#   | 0      | 8           | magic of the format                      |
+#   | 8      | 2           | version (uint16, little endian)          |
+#   | 10     | 2           | number of columns (uint16)               |
+#   | 12     | 4           | header size in bytes (uint32)            |
+#   | 16     | header - 16 | titles (JSON array, utf-8, space padded) |
+#
+# The header size is a multiple of 8, so the records that follow are aligned.
+
+import json
+import os
+import struct
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+
+from utils.utils import write_csv_rows
+
+# titles of the columns of the CSV files written by the sampler (they have no title row)
+DEFAULT_TITLES_FILE = "device_controller/kikusui.json"
+
+_PREAMBLE = struct.Struct("<8sHHI")
+# records converted per batch (see csv_to_sink)
+_CONVERT_BATCH_SIZE = 4096
+
+
+def record_struct(num_columns: int) -> struct.Struct:
+    '''
+    1 float64 per column, little endian
+    '''
+    return struct.Struct(f"<{num_columns}d")
+
+
+def encode_header(magic: bytes, version: int, titles: tuple[str, ...]) -> bytes:
+    encoded_titles = json.dumps(list(titles)).encode('utf-8')
+    header_size = _PREAMBLE.size + len(encoded_titles)
+    padding = -header_size % 8
+    header_size += padding
+
+    return _PREAMBLE.pack(magic, version, len(titles), header_size) + encoded_titles + b" " * padding
+
+
+def read_header(f, filename: str, magic: bytes, version: int) -> tuple[tuple[str, ...], int, int]:
+    '''
+    f: file opened in binary mode, at its start,
+    returns (titles, number of columns, header size)
+    '''
+    preamble = f.read(_PREAMBLE.size)
+    if len(preamble) < _PREAMBLE.size:
+        raise ValueError(f"{filename}: truncated header")
+
+    file_magic, file_version, num_columns, header_size = _PREAMBLE.unpack(preamble)
+    if file_magic != magic:
+        raise ValueError(f"{filename}: not a sample file of this format (magic {file_magic!r}, expected {magic!r})")
+    if file_version != version:
+        raise ValueError(f"{filename}: unsupported version {file_version}")
+
+    titles = tuple(json.loads(f.read(header_size - _PREAMBLE.size)))
+    return titles, num_columns, header_size
+
+
+def read_titles(titles_file: str = DEFAULT_TITLES_FILE) -> tuple[str, ...]:
+    with open(titles_file) as titles_json:
+        return tuple(json.load(titles_json)["titles"])
+
+
+def read_csv(filename: str) -> Iterator[tuple[float, ...]]:
+    '''
+    records of a CSV file written by the sampler (no title row)
+    '''
+    with open(filename) as csv:
+        for line in csv:
+            if line.strip():
+                yield tuple(float(value) for value in line.split(','))
+
+
+def csv_to_sink(csv_filename: str, sink: "Sink", batch_size: int = _CONVERT_BATCH_SIZE):
+    '''
+    writes the records of a CSV file written by the sampler to sink, then closes it
+    '''
+    batch = []
+    for record in read_csv(csv_filename):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            sink.write_batch(batch)
+            batch = []
+    sink.write_batch(batch)
+    sink.close()
+
+
+def records_to_csv(records: Iterator[tuple[float, ...]], csv_filename: str, batch_size: int = _CONVERT_BATCH_SIZE):
+    with open(csv_filename, 'w') as csv:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                write_csv_rows(csv=csv, rows=batch)
+                batch = []
+        write_csv_rows(csv=csv, rows=batch)
+
+
+class Sink(ABC):
+    '''
+    A file format the writer can store sample records in.
+    '''
+    # extension that replaces the one of the requested filename
+    extension = ""
+
+    @abstractmethod
+    def __init__(self, filename: str, titles: tuple[str, ...]) -> None:
+        '''
+        opens filename for writing, titles name the columns of every record
+        '''
+        pass
+
+    @abstractmethod
+    def write_batch(self, records: list[tuple[float, ...]]):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def next_deadline(self) -> Optional[float]:
+        '''
+        perf_counter by which poll() must be called, even if no records arrive
+        (None: nothing time-based pending)
+        '''
+        return None
+
+    def poll(self):
+        '''
+        time-based work (e.g. syncing buffered records), called by the writer thread
+        '''
+        pass
+
+    @classmethod
+    def output_filename(cls, filename: str) -> str:
+        if not cls.extension:
+            return filename
+
+        return f"{os.path.splitext(filename)[0]}{cls.extension}"
+
+
+class CsvSink(Sink):
+    def __init__(self, filename: str, titles: tuple[str, ...]) -> None:
+        self.filename = filename
+        self.titles = titles
+        self._file = open(filename, 'w')
+
+    def write_batch(self, records: list[tuple[float, ...]]):
+        write_csv_rows(csv=self._file, rows=records)
+
+    def close(self):
+        self._file.close()
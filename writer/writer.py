@@ -0,0 +1,305 @@
+import logging
+import queue
+import threading
+import time
+from typing import Optional
+
+from sampler.metrics import WRITE
+from writer.binary_format import BinarySink
+from writer.compressed_format import CompressedSink
+from writer.sample_log import LogSink
+from writer.sink import CsvSink
+
+# output format -> Sink storing records in that format
+OUTPUT_FORMATS = {
+    "csv": CsvSink,
+    "binary": BinarySink,
+    "compressed": CompressedSink,
+    "log": LogSink,
+}
+DEFAULT_OUTPUT_FORMAT = "csv"
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_FLUSH_INTERVAL = 1.0 # sec
+# how long the owner of a file waits for the writer to close it (see CloseFile.wait)
+DEFAULT_CLOSE_TIMEOUT = 10.0 # sec
+
+
+class OpenFile():
+    '''
+    control message: flush and close the current file, then open a new one
+    '''
+    def __init__(self, filename: str, titles: tuple[str, ...], output_format: str) -> None:
+        self.filename = filename
+        self.titles = titles
+        self.output_format = output_format
+
+
+class CloseFile():
+    '''
+    control message: flush and close the current file
+    '''
+    def __init__(self) -> None:
+        # set by the writer thread once the file is closed
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, error: Optional[str]):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout: float = DEFAULT_CLOSE_TIMEOUT) -> Optional[str]:
+        '''
+        returns the error that stopped the writer from writing the file (None: no error)
+        '''
+        if not self._done.wait(timeout):
+            return f"file not closed by the writer within {timeout} s"
+        return self.error
+
+
+class StopWriter():
+    '''
+    control message: flush, close the current file and stop the writer
+    '''
+    pass
+
+
+class WriterListener():
+    '''
+    Gets the records handled by the writer, on the writer thread.
+    Implementations must not block (they would stall the writer).
+    '''
+    def on_open(self, filename: str, titles: tuple[str, ...]):
+        pass
+
+    def on_batch(self, records: list[tuple[float, ...]]):
+        pass
+
+    def on_close(self):
+        pass
+
+
+class SampleWriter():
+    '''
+    Consumer side of the sampler queue.
+
+    The measuring thread only puts sample records (tuples of floats) and
+    control messages into the queue, the writer thread drains it and
+    writes the records to disk in batches (see OUTPUT_FORMATS).
+    A batch is written once it has batch_size records or once its oldest
+    record has waited for flush_interval seconds, whichever comes first.
+
+    An error writing a file (e.g. disk full) is logged and the records of
+    that file are dropped until the next one is opened: the writer keeps
+    draining the queue, so the measuring thread never blocks on it.
+    The error is returned to the owner of the file when it is closed (see CloseFile).
+    '''
+    def __init__(
+        self,
+        sample_queue: queue.Queue,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        sink_options: Optional[dict] = None,
+    ) -> None:
+        self.queue = sample_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # output format -> keyword arguments of its sink (e.g. { "log": { "sync_interval": 0.5 } })
+        self.sink_options = sink_options or {}
+
+        self.output_file = None
+        self.listeners = []
+        self._batch = []
+        self._flush_deadline = None
+        # error that stopped the writer from writing the current file
+        self.error = None
+
+        self.num_records = 0
+        self.num_dropped = 0
+        self.num_batches = 0
+        self.num_backpressure = 0
+        self.max_queue_depth = 0
+
+        # time spent writing batches (None -> not instrumented, see sampler/metrics.py)
+        self.metrics = None
+
+    def add_listener(self, listener: WriterListener):
+        '''
+        must be called before the writer thread starts
+        '''
+        self.listeners.append(listener)
+
+    # --- producer side (measuring thread) ---
+
+    def put(self, item):
+        '''
+        blocks only when the queue is full (counted as backpressure)
+        '''
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.num_backpressure += 1
+            self.queue.put(item)
+
+    def put_sample(self, values: tuple[float, ...], tick: int, device_id: Optional[str] = None):
+        '''
+        values: one sample, tick: index of its deadline (t0 + tick * interval)
+        '''
+        self.put(values)
+
+    def check_output_file(self, filename: str, output_format: str = DEFAULT_OUTPUT_FORMAT):
+        '''
+        creates the file the writer will open for filename,
+        raises RuntimeError if it cannot be created (e.g. no such directory)
+        '''
+        output_filename = OUTPUT_FORMATS[output_format].output_filename(filename)
+        try:
+            with open(output_filename, 'a'):
+                pass
+        except OSError as err:
+            raise RuntimeError(f"cannot write {output_filename}: {err}") from err
+
+    def open(self, filename: str, titles: tuple[str, ...], output_format: str = DEFAULT_OUTPUT_FORMAT):
+        self.put(OpenFile(filename, titles, output_format))
+
+    def close(self) -> CloseFile:
+        '''
+        returns the control message, to wait for the file to be closed
+        '''
+        item = CloseFile()
+        self.put(item)
+        return item
+
+    def stop(self):
+        self.put(StopWriter())
+
+    # --- consumer side (writer thread) ---
+
+    def write(self):
+        while True:
+            deadline = self._flush_deadline
+            sink_deadline = self.output_file.next_deadline() if self.output_file is not None else None
+            if sink_deadline is not None and (deadline is None or sink_deadline < deadline):
+                deadline = sink_deadline
+
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.perf_counter())
+
+            try:
+                # no pending records -> block without timeout (idle costs nothing)
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                try:
+                    if self._flush_deadline is not None and time.perf_counter() >= self._flush_deadline:
+                        self._flush()
+                    if self.output_file is not None:
+                        self.output_file.poll()
+                except Exception as err:
+                    self._fail(err)
+                continue
+
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize() + 1)
+
+            try:
+                if isinstance(item, tuple):
+                    self._add_record(item)
+                elif isinstance(item, OpenFile):
+                    try:
+                        self._close_output_file()
+                    except Exception as err:
+                        self._fail(err)
+                    self.error = None
+                    self._open_output_file(item)
+                elif isinstance(item, (CloseFile, StopWriter)):
+                    self._close_output_file()
+            except Exception as err:
+                self._fail(err)
+
+            if isinstance(item, CloseFile):
+                item.finish(self.error)
+                self.error = None
+            elif isinstance(item, StopWriter):
+                break
+
+        logging.info("end writing")
+
+    def _fail(self, err: Exception):
+        '''
+        gives up the current file, its records are dropped until the next file is opened
+        '''
+        logging.error(f"Writing {self.output_file.filename if self.output_file is not None else 'samples'} failed: {err!r}")
+        if self.error is None:
+            self.error = repr(err)
+
+        self.num_dropped += len(self._batch)
+        self._batch = []
+        self._flush_deadline = None
+        if self.output_file is not None:
+            try:
+                self.output_file.close()
+            except Exception as close_err:
+                logging.error(f"Closing the output file failed: {close_err!r}")
+            self.output_file = None
+
+    def _add_record(self, record: tuple):
+        self._batch.append(record)
+        if self._flush_deadline is None:
+            self._flush_deadline = time.perf_counter() + self.flush_interval
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        self._flush_deadline = None
+        if not self._batch:
+            return
+
+        if self.output_file is None:
+            if self.error is None:
+                logging.info(f"No output file, dropping {len(self._batch)} records")
+            self.num_dropped += len(self._batch)
+        else:
+            if self.metrics is None:
+                self.output_file.write_batch(self._batch)
+            else:
+                start_time = time.perf_counter()
+                self.output_file.write_batch(self._batch)
+                self.metrics.observe(WRITE, time.perf_counter() - start_time)
+                self.metrics.add("records_written", len(self._batch))
+            self.num_records += len(self._batch)
+            self.num_batches += 1
+
+            for listener in self.listeners:
+                listener.on_batch(self._batch)
+
+        self._batch = []
+
+    def _open_output_file(self, item: OpenFile):
+        sink = OUTPUT_FORMATS[item.output_format]
+        filename = sink.output_filename(item.filename)
+        logging.info(f"Writing {item.output_format} samples to {filename}")
+        self.output_file = sink(filename, item.titles, **self.sink_options.get(item.output_format, {}))
+
+        for listener in self.listeners:
+            listener.on_open(filename, item.titles)
+
+    def _close_output_file(self):
+        self._flush()
+
+        if self.output_file:
+            self.output_file.close()
+            self.output_file = None
+
+            for listener in self.listeners:
+                listener.on_close()
+            logging.info(f"Writer stats: {self.get_stats()}")
+
+    def get_stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "records": self.num_records,
+            "batches": self.num_batches,
+            "dropped": self.num_dropped,
+            "backpressure": self.num_backpressure,
+        }